@@ -1,4 +1,8 @@
+import contextvars
+import functools
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -7,13 +11,131 @@ _ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
 load_dotenv(dotenv_path=_ENV_PATH)
 
 from langchain_openai import ChatOpenAI
-from langchain.agents import initialize_agent, AgentType
-from langchain.tools import Tool
+from langchain.tools import StructuredTool
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
-from app.tools import get_weather_json, compare_weather, summarize_forecast
-from app.prompts import SYSTEM_PROMPT
+from app.tools import get_weather_json, compare_weather, summarize_forecast, summarize_history
+from app.windows import best_windows
+from app.prompts import SYSTEM_PROMPT, ANSWER_WITH_DATA_PROMPT
 from app.schemas import ReasoningStep
 
+# Caps for the tool-calling loop: tool turns per question, total tokens per question
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "4"))
+AGENT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "8000"))
+# Output tokens held back from tool turns so the final answer always has room
+AGENT_ANSWER_TOKENS = 512
+
+# Runs the tool calls of one model turn concurrently
+_tool_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-tool")
+
+
+def get_llm(reasoning_steps: list[ReasoningStep]) -> ChatOpenAI:
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        reasoning_steps.append(ReasoningStep(step="error", detail="Missing OPENROUTER_API_KEY"))
+        raise ValueError("OPENROUTER_API_KEY not configured")
+
+    model_id = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
+    reasoning_steps.append(ReasoningStep(step="llm_init", detail=f"Initializing language model {model_id}"))
+
+    return ChatOpenAI(
+        model=model_id,
+        temperature=0,
+        openai_api_key=api_key,
+        openai_api_base="https://openrouter.ai/api/v1",
+    )
+
+
+class ToolCallingAgent:
+    """Agent loop on the model's native tool calling.
+
+    Each turn the model may request several tool calls; they run
+    concurrently and their results go back as tool messages. Stops when the
+    model answers without tools, or after `max_iterations` tool turns or once
+    fewer than `answer_tokens` of the `max_tokens` budget are left; either
+    limit ends with one last call answering from the data gathered so far.
+
+    Every call's output is capped (max_tokens) so that its estimated prompt,
+    its output and the final call still fit the budget. Prompt sizes are
+    estimated from the previous call's reported usage plus ~4 characters
+    per token for messages added since, so the total can still overshoot
+    slightly; the final answer always gets at least `answer_tokens`.
+    """
+
+    def __init__(self, llm: ChatOpenAI, tools: list, reasoning_steps: list[ReasoningStep],
+                 max_iterations: int = 4, max_tokens: int = 8000, answer_tokens: int = AGENT_ANSWER_TOKENS):
+        self.llm = llm
+        self.tools = {t.name: t for t in tools}
+        self.tool_specs = [convert_to_openai_tool(t) for t in tools]
+        self.reasoning_steps = reasoning_steps
+        self.max_iterations = max_iterations
+        self.max_tokens = max_tokens
+        self.answer_tokens = answer_tokens
+        self.tokens_used = 0
+        # (tokens of the last call's prompt + reply, messages they covered)
+        self._last_prompt = (len(json.dumps(self.tool_specs)) // 4, 0)
+
+    def _prompt_estimate(self, messages: list) -> int:
+        base, covered = self._last_prompt
+        added = messages[covered:]
+        return base + sum(len(str(m.content)) for m in added) // 4 + 8 * len(added)
+
+    def _remaining(self) -> int:
+        return self.max_tokens - self.tokens_used
+
+    def _generate(self, messages: list, with_tools: bool, max_output: int) -> AIMessage:
+        # The history holds tool calls, so tools are always declared; some
+        # providers reject it otherwise. tool_choice="none" forces an answer.
+        kwargs = {"max_tokens": max_output, "tools": self.tool_specs}
+        if not with_tools:
+            kwargs["tool_choice"] = "none"
+        prompt = self._prompt_estimate(messages)
+        result = self.llm.generate([messages], **kwargs)
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        self.tokens_used += usage.get("total_tokens", 0)
+        # The reply is appended next, so it counts as covered
+        self._last_prompt = (usage.get("total_tokens") or prompt + max_output, len(messages) + 1)
+        return result.generations[0][0].message
+
+    def _run_tool(self, call: dict) -> str:
+        fn = call.get("function") or {}
+        tool = self.tools.get(fn.get("name"))
+        if tool is None:
+            return f"Unknown tool {fn.get('name')}"
+        try:
+            args = json.loads(fn.get("arguments") or "{}")
+            return str(tool.invoke(args))
+        except Exception as e:
+            self.reasoning_steps.append(ReasoningStep(step="error", detail=f"{tool.name} failed: {e}"))
+            return f"{tool.name} failed: {e}"
+
+    def run(self, message: str) -> str:
+        messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=message)]
+        for turn in range(1, self.max_iterations + 1):
+            # This turn's output also lands in the final call's prompt, hence // 2
+            prompt = self._prompt_estimate(messages)
+            budget = (self._remaining() - 2 * prompt - self.answer_tokens) // 2
+            if budget <= 0:
+                self.reasoning_steps.append(ReasoningStep(step="llm_call", detail=f"Token budget ({self.max_tokens}) nearly used; answering from gathered data"))
+                break
+            ai = self._generate(messages, with_tools=True, max_output=budget)
+            calls = ai.additional_kwargs.get("tool_calls") or []
+            if not calls:
+                return ai.content
+            self.reasoning_steps.append(ReasoningStep(step="llm_call", detail=f"Turn {turn}: {len(calls)} tool call(s) requested"))
+            messages.append(ai)
+            # Each call gets its own copy of the context, so tools fan out on
+            # the fetch executor of the pool this agent runs on
+            runs = [functools.partial(contextvars.copy_context().run, self._run_tool, c) for c in calls]
+            outputs = list(_tool_pool.map(lambda run: run(), runs))
+            for call, out in zip(calls, outputs):
+                messages.append(ToolMessage(content=out, tool_call_id=call["id"]))
+        else:
+            self.reasoning_steps.append(ReasoningStep(step="llm_call", detail=f"Iteration limit ({self.max_iterations}) reached; answering from gathered data"))
+        left = self._remaining() - self._prompt_estimate(messages)
+        return self._generate(messages, with_tools=False, max_output=max(left, self.answer_tokens)).content
+
 
 def get_agent():
     reasoning_steps: list[ReasoningStep] = []
@@ -25,17 +147,11 @@ def get_agent():
             reasoning_steps.append(ReasoningStep(step="error", detail=f"Weather unavailable for {city}"))
             return f"Weather unavailable for {city}"
         reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Weather received for {city}"))
-        # Return compact human string but the agent can still parse numbers in other flows
         return f"{data['city']}: {data['temp']}°C, humidity {data['humidity']}%, wind {data['wind_kmh']} km/h, {data['condition']}"
 
-    def compare_tool(arg: str) -> str:
-        # Input format: "city1, city2"
-        parts = [p.strip() for p in (arg or "").split(",") if p.strip()]
-        if len(parts) < 2:
-            return "Provide two cities separated by a comma (e.g., Pune, Nashik)."
-        c1, c2 = parts[0], parts[1]
-        reasoning_steps.append(ReasoningStep(step="tool_call", detail=f"Comparing weather: {c1} vs {c2}"))
-        res = compare_weather(c1, c2)
+    def compare_tool(city1: str, city2: str) -> str:
+        reasoning_steps.append(ReasoningStep(step="tool_call", detail=f"Comparing weather: {city1} vs {city2}"))
+        res = compare_weather(city1, city2)
         if not res or not res.get("city1_weather") or not res.get("city2_weather"):
             reasoning_steps.append(ReasoningStep(step="error", detail="Comparison failed"))
             return "Unable to compare due to missing weather data."
@@ -48,46 +164,107 @@ def get_agent():
             f"{w2['city']}: {w2['temp']}°C, {w2['humidity']}% hum, {w2['wind_kmh']} km/h wind"
         )
 
+    def forecast_tool(city: str) -> str:
+        reasoning_steps.append(ReasoningStep(step="tool_call", detail=f"Fetching forecast for {city}"))
+        res = summarize_forecast(city)
+        if not res.get("summary"):
+            reasoning_steps.append(ReasoningStep(step="error", detail=f"Forecast unavailable for {city}"))
+            return res.get("error") or f"Forecast unavailable for {city}"
+        reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Forecast received for {city}"))
+        return f"{res['city']}: {res['summary']}"
+
+    def history_tool(city: str, days: int = 1) -> str:
+        reasoning_steps.append(ReasoningStep(step="tool_call", detail=f"Reading {days} day(s) of history for {city}"))
+        res = summarize_history(city, days)
+        if not res.get("summary"):
+            reasoning_steps.append(ReasoningStep(step="error", detail=res.get("error") or f"No history for {city}"))
+            return res.get("error") or f"No history for {city}"
+        reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"History received for {city}"))
+        return f"{res['city']}: {res['summary']}"
+
+    def best_window_tool(cities: str, hours: int = 6) -> str:
+        names = [c.strip() for c in cities.split(",") if c.strip()]
+        reasoning_steps.append(ReasoningStep(step="tool_call", detail=f"Finding best {hours}-hour windows for {', '.join(names)}"))
+        res = best_windows(names, hours)
+        if not res:
+            reasoning_steps.append(ReasoningStep(step="error", detail="Forecast unavailable"))
+            return f"Forecast unavailable for {cities}"
+        reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Best windows found for {len(res['cities'])} city(ies)"))
+        return res["summary"]
+
     tools = [
-        Tool(
-            name="WeatherTool",
+        StructuredTool.from_function(
             func=weather_tool,
-            description="Get structured weather summary for a city"
+            name="WeatherTool",
+            description="Get current weather for a city"
         ),
-        Tool(
-            name="CompareWeather",
+        StructuredTool.from_function(
             func=compare_tool,
-            description="Compare weather between two cities. Input format: 'city1, city2'"
+            name="CompareWeather",
+            description="Compare current weather between two cities and pick the better one for travel"
         ),
-        Tool(
+        StructuredTool.from_function(
+            func=forecast_tool,
             name="ForecastTool",
-            func=lambda city: summarize_forecast(city),
-            description="Provides next 5-day average forecast summary for a city. Input: city name"
+            description="Provides next 5-day average forecast summary for a city"
+        ),
+        StructuredTool.from_function(
+            func=history_tool,
+            name="HistoryTool",
+            description="Past observed weather for a city over the last N days (averages, min/max, daily breakdown)"
+        ),
+        StructuredTool.from_function(
+            func=best_window_tool,
+            name="BestWindowTool",
+            description="Best upcoming time windows of N hours (default 6) over the 5-day forecast, per city and overall; cities is a comma-separated list"
         ),
     ]
 
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        reasoning_steps.append(ReasoningStep(step="error", detail="Missing OPENROUTER_API_KEY"))
-        raise ValueError("OPENROUTER_API_KEY not configured")
+    llm = get_llm(reasoning_steps)
 
-    model_id = os.getenv("OPENROUTER_MODEL", "openai/gpt-4o-mini")
-    reasoning_steps.append(ReasoningStep(step="llm_init", detail=f"Initializing language model {model_id}"))
-
-    llm = ChatOpenAI(
-        model=model_id,
-        temperature=0,
-        openai_api_key=api_key,
-        openai_api_base="https://openrouter.ai/api/v1",
-    )
-
-    agent = initialize_agent(
-        tools=tools,
-        llm=llm,
-        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-        verbose=False,
-        # Some versions accept agent_kwargs for system prompts; keep safe default.
-        # agent_kwargs={"system_message": SYSTEM_PROMPT}
+    agent = ToolCallingAgent(
+        llm,
+        tools,
+        reasoning_steps,
+        max_iterations=AGENT_MAX_ITERATIONS,
+        max_tokens=AGENT_MAX_TOKENS,
     )
 
     return agent, reasoning_steps
+
+
+def _format_city_data(city: str, data: dict) -> str:
+    parts = []
+    w = data.get("weather")
+    if w:
+        parts.append(
+            f"now {w['temp']}°C (feels {w['feels']}°C), humidity {w['humidity']}%, "
+            f"wind {w['wind_kmh']} km/h, visibility {w['visibility']} km, {w['condition']}"
+        )
+    f = data.get("forecast") or {}
+    if f.get("summary"):
+        parts.append(f"next 5 days: {f['summary']}")
+        raw = f.get("raw")
+        if raw is not None and len(raw):
+            # Next ~24h as compact "time temp condition" tokens
+            upcoming = ", ".join(f"{b.dt_txt[5:16]} {b.temp:.0f}°C {b.condition}" for b in map(raw.block, range(min(8, len(raw)))))
+            parts.append(f"next 24h: {upcoming}")
+    if not parts:
+        return f"- {city}: data unavailable"
+    name = w["city"] if w else city
+    return f"- {name}: " + "; ".join(parts)
+
+
+def answer_with_data(message: str, city_data: dict, reasoning_steps: list[ReasoningStep]) -> str:
+    """Answer in a single LLM call from pre-fetched weather (see tools.prefetch_cities)."""
+    llm = get_llm(reasoning_steps)
+    data = "\n".join(_format_city_data(c, d) for c, d in city_data.items())
+    messages = [
+        SystemMessage(content=ANSWER_WITH_DATA_PROMPT.format(data=data)),
+        HumanMessage(content=message),
+    ]
+    reasoning_steps.append(ReasoningStep(step="llm_call", detail=f"Single-shot answer with data for {len(city_data)} city(ies)"))
+    answer = llm.invoke(messages).content
+    if not answer or not answer.strip():
+        raise ValueError("Empty answer from language model")
+    return answer
@@ -0,0 +1,241 @@
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from threading import Lock
+
+EARTH_RADIUS_KM = 6371.0088
+# Geocoded cities kept in the index on top of the seeds (oldest dropped first)
+CITY_INDEX_MAX_ADDED = 5000
+
+# Seed cities so nearby queries work before anything has been geocoded;
+# every city resolved by tools.get_coordinates is added on top.
+_SEED_CITIES = [
+    ("Mumbai", 19.08, 72.88), ("Thane", 19.22, 72.98), ("Pune", 18.52, 73.86),
+    ("Lonavala", 18.75, 73.41), ("Alibag", 18.64, 72.87), ("Nashik", 20.00, 73.79),
+    ("Igatpuri", 19.70, 73.56), ("Shirdi", 19.77, 74.48), ("Aurangabad", 19.88, 75.34),
+    ("Nagpur", 21.15, 79.09), ("Satara", 17.68, 74.02), ("Mahabaleshwar", 17.92, 73.66),
+    ("Kolhapur", 16.70, 74.24), ("Solapur", 17.66, 75.91), ("Ratnagiri", 16.99, 73.31),
+    ("Panaji", 15.49, 73.83), ("Margao", 15.27, 73.96), ("Belagavi", 15.85, 74.50),
+    ("Hubli", 15.36, 75.12), ("Bengaluru", 12.97, 77.59), ("Mysuru", 12.30, 76.64),
+    ("Mangaluru", 12.91, 74.86), ("Hyderabad", 17.39, 78.49), ("Chennai", 13.08, 80.27),
+    ("Coimbatore", 11.02, 76.96), ("Ooty", 11.41, 76.70), ("Kochi", 9.93, 76.27),
+    ("Thiruvananthapuram", 8.52, 76.94), ("Visakhapatnam", 17.69, 83.22), ("Bhubaneswar", 20.30, 85.82),
+    ("Kolkata", 22.57, 88.36), ("Patna", 25.59, 85.14), ("Varanasi", 25.32, 82.97),
+    ("Lucknow", 26.85, 80.95), ("Agra", 27.18, 78.01), ("Delhi", 28.61, 77.21),
+    ("Jaipur", 26.91, 75.79), ("Udaipur", 24.59, 73.71), ("Ahmedabad", 23.02, 72.57),
+    ("Vadodara", 22.31, 73.18), ("Surat", 21.17, 72.83), ("Indore", 22.72, 75.86),
+    ("Bhopal", 23.26, 77.41), ("Chandigarh", 30.73, 76.78), ("Amritsar", 31.63, 74.87),
+    ("Shimla", 31.10, 77.17), ("Manali", 32.24, 77.19), ("Dehradun", 30.32, 78.03),
+    ("Rishikesh", 30.09, 78.27), ("Guwahati", 26.14, 91.74),
+]
+
+
+def _to_xyz(lat: float, lon: float) -> tuple:
+    la, lo = math.radians(lat), math.radians(lon)
+    c = math.cos(la)
+    return (c * math.cos(lo), c * math.sin(lo), math.sin(la))
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+class _Node:
+    __slots__ = ("xyz", "name", "axis", "left", "right")
+
+    def __init__(self, xyz, name, axis=0, left=None, right=None):
+        self.xyz = xyz
+        self.name = name
+        self.axis = axis
+        self.left = left
+        self.right = right
+
+
+def _build(nodes: list, depth: int = 0):
+    if not nodes:
+        return None
+    axis = depth % 3
+    nodes.sort(key=lambda n: n.xyz[axis])
+    mid = len(nodes) // 2
+    node = nodes[mid]
+    node.axis = axis
+    node.left = _build(nodes[:mid], depth + 1)
+    node.right = _build(nodes[mid + 1:], depth + 1)
+    return node
+
+
+def _insert(root, node) -> int:
+    """Hang node under root as a new leaf; returns its depth."""
+    depth = 1
+    parent = root
+    while True:
+        side = "left" if node.xyz[parent.axis] < parent.xyz[parent.axis] else "right"
+        child = getattr(parent, side)
+        if child is None:
+            node.axis = (parent.axis + 1) % 3
+            setattr(parent, side, node)
+            return depth
+        parent = child
+        depth += 1
+
+
+def _dist2(a, b) -> float:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class CityIndex:
+    """k-d tree over cities as points on the unit sphere.
+
+    Straight-line (chord) distance between unit vectors grows monotonically
+    with great-circle distance, so a plain 3-D k-d tree answers nearest and
+    radius queries correctly across the antimeridian and poles.
+
+    New cities are inserted as leaves in O(depth). Cities added after
+    construction are kept up to `max_added`, least recently added first
+    out; evicted or moved cities leave dead nodes behind. When dead nodes
+    pile up or the tree gets too deep, it is rebuilt balanced on a
+    background thread while queries keep using the old one.
+    """
+
+    def __init__(self, cities=(), max_added: int = CITY_INDEX_MAX_ADDED):
+        self.max_added = max_added
+        self._coords: dict[str, tuple] = {}
+        self._live: dict[str, _Node] = {}   # the one node per city that queries report
+        self._added: OrderedDict[str, None] = OrderedDict()
+        self._nodes = 0
+        self._rebuilding = False
+        self._pending: list[str] = []       # cities (re)inserted during a rebuild
+        self._lock = Lock()
+        for name, lat, lon in cities:
+            self._coords[name] = (lat, lon)
+            self._live[name] = _Node(_to_xyz(lat, lon), name)
+        self._nodes = len(self._live)
+        self._root = _build(list(self._live.values()))
+        self._view = (self._root, self._live)  # swapped as one so queries never mix trees
+
+    def add(self, name: str, lat: float, lon: float):
+        with self._lock:
+            if name in self._added:
+                self._added.move_to_end(name)
+            elif name not in self._coords:
+                self._added[name] = None
+            if self._coords.get(name) == (lat, lon):
+                return
+            self._coords[name] = (lat, lon)
+            node = _Node(_to_xyz(lat, lon), name)
+            if self._root is None:
+                self._root, depth = node, 1
+                self._view = (self._root, self._live)
+            else:
+                depth = _insert(self._root, node)
+            self._live[name] = node
+            self._nodes += 1
+            if self._rebuilding:
+                self._pending.append(name)
+            while len(self._added) > self.max_added:
+                old, _ = self._added.popitem(last=False)
+                del self._coords[old]
+                del self._live[old]
+            unbalanced = depth > 3 * max(1, len(self._live)).bit_length() + 4
+            if (unbalanced or self._nodes > 2 * len(self._live) + 16) and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name="city-index-rebuild", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            with self._lock:
+                snapshot = list(self._coords.items())
+                self._pending = []
+            nodes = [_Node(_to_xyz(lat, lon), name) for name, (lat, lon) in snapshot]
+            root = _build(list(nodes))
+            with self._lock:
+                live = {n.name: n for n in nodes if self._coords.get(n.name) is not None}
+                # Replay cities inserted while building, at their current coordinates
+                for name in dict.fromkeys(self._pending):
+                    coords = self._coords.get(name)
+                    if coords is None:
+                        continue
+                    node = _Node(_to_xyz(*coords), name)
+                    if root is None:
+                        root = node
+                    else:
+                        _insert(root, node)
+                    live[name] = node
+                    nodes.append(node)
+                self._root, self._live, self._nodes = root, live, len(nodes)
+                self._view = (root, live)
+        finally:
+            with self._lock:
+                self._pending = []
+                self._rebuilding = False
+
+    def get(self, name: str):
+        return self._coords.get(name)
+
+    def __len__(self):
+        return len(self._coords)
+
+    def nearest(self, lat: float, lon: float, k: int = 5, exclude=(), min_km: float = 0.0) -> list[tuple[str, float]]:
+        """Return up to k (name, distance_km) pairs ordered by distance.
+
+        Cities named in `exclude` (case-insensitive) or closer than min_km
+        are skipped during the search, so they never cost a result slot.
+        """
+        q = _to_xyz(lat, lon)
+        root, live = self._view
+        skip = {n.lower() for n in exclude}
+        min_d2 = _km_to_chord(min_km) ** 2 if min_km > 0 else -1.0
+        heap: list = []  # max-heap on distance via negated squared chord
+
+        def visit(node):
+            if node is None:
+                return
+            d2 = _dist2(q, node.xyz)
+            if d2 >= min_d2 and live.get(node.name) is node and node.name.lower() not in skip:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d2, node.name))
+                elif d2 < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d2, node.name))
+            diff = q[node.axis] - node.xyz[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            visit(near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(far)
+
+        if k > 0:
+            visit(root)
+        return [(name, round(_chord_to_km(math.sqrt(-nd2)), 1)) for nd2, name in sorted(heap, reverse=True)]
+
+    def within(self, lat: float, lon: float, radius_km: float, exclude=(), min_km: float = 0.0) -> list[tuple[str, float]]:
+        """Return all (name, distance_km) pairs within radius_km, nearest first (skips as in nearest)."""
+        q = _to_xyz(lat, lon)
+        r = _km_to_chord(radius_km)
+        r2 = r * r
+        root, live = self._view
+        skip = {n.lower() for n in exclude}
+        min_d2 = _km_to_chord(min_km) ** 2 if min_km > 0 else -1.0
+        found = []
+
+        def visit(node):
+            if node is None:
+                return
+            d2 = _dist2(q, node.xyz)
+            if min_d2 <= d2 <= r2 and live.get(node.name) is node and node.name.lower() not in skip:
+                found.append((d2, node.name))
+            diff = q[node.axis] - node.xyz[node.axis]
+            if diff - r <= 0:
+                visit(node.left)
+            if diff + r >= 0:
+                visit(node.right)
+
+        visit(root)
+        found.sort()
+        return [(name, round(_chord_to_km(math.sqrt(d2)), 1)) for d2, name in found]
+
+
+city_index = CityIndex(_SEED_CITIES)
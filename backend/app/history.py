@@ -0,0 +1,227 @@
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+
+# Observation history lives next to the app unless HISTORY_DIR says otherwise;
+# set HISTORY_DIR to an empty string to disable recording.
+_DEFAULT_DIR = Path(__file__).resolve().parents[1] / "data" / "history"
+HISTORY_DIR = os.getenv("HISTORY_DIR", str(_DEFAULT_DIR))
+
+# One file per column per (city, month) segment; all little-endian, fixed width
+COLUMNS = {
+    "ts": np.dtype("<i8"),
+    "temp": np.dtype("<f4"),
+    "feels": np.dtype("<f4"),
+    "humidity": np.dtype("<f4"),
+    "wind": np.dtype("<f4"),
+}
+
+DAILY_DTYPE = np.dtype([
+    ("day", "<i4"),          # days since 1970-01-01 (UTC)
+    ("count", "<u4"),
+    ("temp_min", "<f4"),
+    ("temp_max", "<f4"),
+    ("temp_sum", "<f8"),
+    ("humidity_sum", "<f8"),
+    ("wind_sum", "<f8"),
+])
+
+
+def _slug(city: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", (city or "").strip().lower()).strip("_")
+
+
+def _month(ts: int) -> str:
+    return time.strftime("%Y-%m", time.gmtime(ts))
+
+
+def _months_between(start: int, end: int) -> set[str]:
+    y, m = map(int, _month(start).split("-"))
+    last = _month(end)
+    out = set()
+    while True:
+        key = f"{y:04d}-{m:02d}"
+        out.add(key)
+        if key >= last:
+            return out
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+def _memmap(path: Path, dtype) -> np.ndarray:
+    size = path.stat().st_size if path.exists() else 0
+    n = size // dtype.itemsize
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+
+class HistoryStore:
+    """Append-only, per-city columnar time series of weather observations.
+
+    Layout: <root>/<city>/<YYYY-MM>/<column>.bin plus <root>/<city>/daily.bin.
+    Observations are appended in time order, so range queries are a binary
+    search over the memory-mapped timestamp column of each monthly segment.
+    The daily rollup file holds one row per UTC day; only its last row is
+    ever rewritten.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._lock = Lock()
+        self._last_ts: dict[str, int] = {}
+
+    # -- writes -------------------------------------------------------------
+
+    def _latest_ts(self, slug: str) -> int:
+        if slug not in self._last_ts:
+            city_dir = self.root / slug
+            segments = sorted(p for p in city_dir.iterdir() if p.is_dir()) if city_dir.exists() else []
+            last = 0
+            if segments:
+                n = self._repair(segments[-1])
+                if n:
+                    last = int(_memmap(segments[-1] / "ts.bin", COLUMNS["ts"])[-1])
+            self._last_ts[slug] = last
+        return self._last_ts[slug]
+
+    @staticmethod
+    def _repair(seg: Path) -> int:
+        """Trim columns of an interrupted append back to the ts column length."""
+        ts_path = seg / "ts.bin"
+        n = (ts_path.stat().st_size if ts_path.exists() else 0) // COLUMNS["ts"].itemsize
+        for name, dtype in COLUMNS.items():
+            path = seg / f"{name}.bin"
+            if path.exists() and path.stat().st_size != n * dtype.itemsize:
+                os.truncate(path, n * dtype.itemsize)
+        return n
+
+    def append(self, city: str, ts: int, temp: float, feels: float, humidity: float, wind: float) -> bool:
+        """Record one observation; returns False for duplicates or out-of-order timestamps."""
+        slug = _slug(city)
+        if not slug:
+            return False
+        ts = int(ts)
+        with self._lock:
+            if ts <= self._latest_ts(slug):
+                return False
+            seg = self.root / slug / _month(ts)
+            seg.mkdir(parents=True, exist_ok=True)
+            values = {"ts": ts, "temp": temp, "feels": feels, "humidity": humidity, "wind": wind}
+            # Timestamp last: a reader never sees a ts without its values
+            for name in ("temp", "feels", "humidity", "wind", "ts"):
+                with open(seg / f"{name}.bin", "ab") as f:
+                    f.write(np.array([values[name]], dtype=COLUMNS[name]).tobytes())
+            self._roll_up(slug, ts, temp, humidity, wind)
+            self._last_ts[slug] = ts
+        return True
+
+    def _roll_up(self, slug: str, ts: int, temp: float, humidity: float, wind: float):
+        path = self.root / slug / "daily.bin"
+        day = ts // 86400
+        size = DAILY_DTYPE.itemsize
+        with open(path, "r+b" if path.exists() else "w+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            end -= end % size  # ignore a torn trailing row
+            row = None
+            if end:
+                f.seek(end - size)
+                last = np.frombuffer(f.read(size), dtype=DAILY_DTYPE)[0].copy()
+                if int(last["day"]) == day:
+                    row, offset = last, end - size
+            if row is None:
+                row, offset = np.zeros(1, dtype=DAILY_DTYPE)[0], end
+                row["day"] = day
+                row["temp_min"] = temp
+                row["temp_max"] = temp
+            row["count"] += 1
+            row["temp_min"] = min(row["temp_min"], temp)
+            row["temp_max"] = max(row["temp_max"], temp)
+            row["temp_sum"] += temp
+            row["humidity_sum"] += humidity
+            row["wind_sum"] += wind
+            f.seek(offset)
+            f.write(np.array([row], dtype=DAILY_DTYPE).tobytes())
+
+    def record(self, w, city: str | None = None) -> bool:
+        """Append a WeatherRecord (from tools.get_weather_json) under city (default w.city)."""
+        return self.append(city or w.city, w.observed_at, w.temp, w.feels, w.humidity, w.wind)
+
+    # -- reads --------------------------------------------------------------
+
+    def range(self, city: str, start: int, end: int) -> dict:
+        """Raw observations with start <= ts <= end as column arrays."""
+        city_dir = self.root / _slug(city)
+        parts = {name: [] for name in COLUMNS}
+        if city_dir.exists():
+            wanted = _months_between(start, end)
+            for seg in sorted(p for p in city_dir.iterdir() if p.is_dir() and p.name in wanted):
+                ts = _memmap(seg / "ts.bin", COLUMNS["ts"])
+                lo = int(np.searchsorted(ts, start, side="left"))
+                hi = int(np.searchsorted(ts, end, side="right"))
+                if hi <= lo:
+                    continue
+                parts["ts"].append(np.array(ts[lo:hi]))
+                for name in ("temp", "feels", "humidity", "wind"):
+                    parts[name].append(np.array(_memmap(seg / f"{name}.bin", COLUMNS[name])[lo:hi]))
+        return {
+            name: (np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMNS[name]))
+            for name, chunks in parts.items()
+        }
+
+    def aggregate(self, city: str, start: int, end: int) -> dict:
+        """Count/mean/min/max over raw observations in [start, end]."""
+        cols = self.range(city, start, end)
+        n = len(cols["ts"])
+        if n == 0:
+            return {"count": 0}
+        t = cols["temp"]
+        return {
+            "count": n,
+            "first": int(cols["ts"][0]),
+            "last": int(cols["ts"][-1]),
+            "temp_avg": round(float(t.mean()), 1),
+            "temp_min": round(float(t.min()), 1),
+            "temp_max": round(float(t.max()), 1),
+            "humidity_avg": round(float(cols["humidity"].mean()), 0),
+            "wind_avg": round(float(cols["wind"].mean()), 1),
+        }
+
+    def daily(self, city: str, start: int, end: int) -> list[dict]:
+        """Per-UTC-day rollups for days overlapping [start, end]."""
+        rows = _memmap(self.root / _slug(city) / "daily.bin", DAILY_DTYPE)
+        if not len(rows):
+            return []
+        days = rows["day"]
+        lo = int(np.searchsorted(days, start // 86400, side="left"))
+        hi = int(np.searchsorted(days, end // 86400, side="right"))
+        out = []
+        for r in rows[lo:hi]:
+            n = int(r["count"])
+            out.append({
+                "date": time.strftime("%Y-%m-%d", time.gmtime(int(r["day"]) * 86400)),
+                "count": n,
+                "temp_avg": round(float(r["temp_sum"]) / n, 1),
+                "temp_min": round(float(r["temp_min"]), 1),
+                "temp_max": round(float(r["temp_max"]), 1),
+                "humidity_avg": round(float(r["humidity_sum"]) / n, 0),
+                "wind_avg": round(float(r["wind_sum"]) / n, 1),
+            })
+        return out
+
+
+history = HistoryStore(HISTORY_DIR) if HISTORY_DIR else None
+
+
+def record_observation(w, city: str | None = None):
+    """Best-effort append of a fetched WeatherRecord; never raises."""
+    if history is None or not w:
+        return
+    try:
+        history.record(w, city)
+    except Exception:
+        logging.exception("History append failed")
@@ -1,6 +1,6 @@
 import re
 from app.schemas import IntentResult
-from app.tools import search_city_candidates
+from app.tools import search_city_candidates, resolve_city_candidates
 
 
 def _normalize_city(name: str) -> str:
@@ -86,6 +86,11 @@ def extract_cities(message: str) -> list[str]:
     return deduped
 
 
+def _fallback_words(text: str) -> list[str]:
+    # Distinct words of length >= 3, tried one by one when no extracted candidate validates
+    return list(dict.fromkeys(re.findall(r"[a-zA-Z][\w\-']{2,}", text)))
+
+
 def detect_intent(message: str) -> IntentResult:
     text = message.lower()
 
@@ -100,12 +105,7 @@ def detect_intent(message: str) -> IntentResult:
 
     # If none validated from extraction, fall back to per-word lookup
     if not validated:
-        raw_words = re.findall(r"[a-zA-Z][\w\-']{2,}", text)  # words length >= 3
-        seen = set()
-        for w in raw_words:
-            if w in seen:
-                continue
-            seen.add(w)
+        for w in _fallback_words(text):
             name = search_city_candidates(w)
             if name:
                 validated.append(name)
@@ -116,7 +116,11 @@ def detect_intent(message: str) -> IntentResult:
     future_keywords = ["tomorrow", "next", "forecast", "weekend", "later", "future", "evening", "tonight"]
     has_future = any(w in text for w in future_keywords)
 
-    if any(w in text for w in ["compare", "vs", "difference"]) or (len(cities) >= 2 and "which" in text):
+    if cities and re.search(r"\bnear(?:by)?\b|\bclose to\b|\bwithin\s+\d+\s*(?:km|kms|kilomet(?:er|re)s?)\b", text):
+        intent = "nearby"
+    elif cities and re.search(r"\bbest (?:\d{1,2}\s*-?\s*(?:h|hrs?|hours?)\s+)?(?:time|window|day|slot|block)s?\b|\bwhen\b.*\b(?:best|ideal|good)\b", text):
+        intent = "best_window"
+    elif any(w in text for w in ["compare", "vs", "difference"]) or (len(cities) >= 2 and "which" in text):
         intent = "comparison"
     elif has_future:
         intent = "forecast"
@@ -135,3 +139,23 @@ def detect_intent(message: str) -> IntentResult:
         confidence=confidence,
         is_multi_city=len(cities) > 1,
     )
+
+
+def detect_intents(messages: list[str]) -> list[IntentResult | None]:
+    """detect_intent over many messages, geocoding each distinct candidate once.
+
+    Blank messages map to None.
+    """
+    extracted = {i: extract_cities(m) for i, m in enumerate(messages) if m.strip()}
+    # Warm the candidate cache concurrently so per-message detection is local:
+    # first the extracted candidates, then the per-word fallback of every
+    # message none of whose candidates validated
+    resolved = resolve_city_candidates([c for cands in extracted.values() for c in cands])
+    fallback = [
+        w
+        for i, cands in extracted.items()
+        if not any(resolved.get(c) for c in cands)
+        for w in _fallback_words(messages[i].lower())
+    ]
+    resolve_city_candidates(fallback)
+    return [detect_intent(m) if m.strip() else None for m in messages]
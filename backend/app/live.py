@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+
+from app.pools import fast_pool
+from app.serialization import encode_weather_list
+from app.tools import get_weather_json
+
+# How often each watched city is refreshed; values below WEATHER_CACHE_TTL
+# mostly hit the weather cache rather than upstream
+LIVE_REFRESH_SECONDS = float(os.getenv("LIVE_REFRESH_SECONDS", "60"))
+LIVE_MAX_CITIES = 50
+
+
+def event_bytes(kind: str, records: list) -> bytes:
+    """{"type": kind, "data": [...]} spliced from cached per-record bytes."""
+    return b'{"type":"' + kind.encode() + b'","data":' + encode_weather_list(records) + b"}"
+
+
+def _normalize(cities: list[str]) -> set[str]:
+    keys = list(dict.fromkeys(c.strip().lower() for c in cities if isinstance(c, str) and c.strip()))
+    return set(keys[:LIVE_MAX_CITIES])
+
+
+class Subscription:
+    """One client's view of the hub: its cities and a bounded outbox."""
+
+    def __init__(self, cities: set[str]):
+        self.cities = cities
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+
+    def push(self, payload: bytes):
+        # A slow client loses its oldest pending update rather than stalling the hub
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(payload)
+
+
+class LiveHub:
+    """Shares one refresh loop across all subscribers.
+
+    Each distinct watched city is fetched once per interval no matter how
+    many clients watch it, and only records whose observation changed are
+    pushed, to just the subscribers watching that city. Concurrent fetches
+    of the same city (snapshots for new subscribers, the refresh loop)
+    share one in-flight request.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._subs: set[Subscription] = set()
+        self._latest: dict[str, object] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._task: asyncio.Task | None = None
+
+    def watched(self) -> set[str]:
+        return set().union(*(s.cities for s in self._subs)) if self._subs else set()
+
+    def _fetch_one(self, city: str) -> asyncio.Future:
+        fut = self._inflight.get(city)
+        if fut is None:
+            fut = asyncio.ensure_future(fast_pool.run(get_weather_json, city))
+            self._inflight[city] = fut
+            fut.add_done_callback(lambda _, c=city: self._inflight.pop(c, None))
+        return fut
+
+    async def _fetch(self, cities) -> dict:
+        cities = list(cities)
+        # shield: a subscriber going away must not cancel a fetch others await
+        results = await asyncio.gather(
+            *(asyncio.shield(self._fetch_one(c)) for c in cities),
+            return_exceptions=True,
+        )
+        return {c: r for c, r in zip(cities, results) if r and not isinstance(r, BaseException)}
+
+    async def _send_snapshot(self, sub: Subscription):
+        missing = sub.cities - self._latest.keys()
+        if missing:
+            self._latest.update(await self._fetch(missing))
+        snapshot = [self._latest[c] for c in sorted(sub.cities) if c in self._latest]
+        sub.push(event_bytes("snapshot", snapshot))
+
+    async def subscribe(self, cities: list[str]) -> Subscription:
+        sub = Subscription(_normalize(cities))
+        self._subs.add(sub)
+        try:
+            await self._send_snapshot(sub)
+        except BaseException:
+            self._subs.discard(sub)
+            raise
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return sub
+
+    async def update(self, sub: Subscription, cities: list[str]):
+        """Replace a subscription's cities and send it a fresh snapshot."""
+        sub.cities = _normalize(cities)
+        await self._send_snapshot(sub)
+
+    def unsubscribe(self, sub: Subscription):
+        self._subs.discard(sub)
+
+    async def _run(self):
+        while self._subs:
+            await asyncio.sleep(self.interval)
+            watched = self.watched()
+            # Forget cities nobody watches any more
+            for c in self._latest.keys() - watched:
+                del self._latest[c]
+            try:
+                fresh = await self._fetch(watched)
+            except Exception:
+                logging.exception("Live refresh failed")
+                continue
+            changed = {}
+            for c, w in fresh.items():
+                prev = self._latest.get(c)
+                if prev is None or prev.observed_at != w.observed_at:
+                    changed[c] = w
+                self._latest[c] = w
+            if not changed:
+                continue
+            for sub in list(self._subs):
+                mine = [changed[c] for c in sorted(sub.cities) if c in changed]
+                if mine:
+                    sub.push(event_bytes("update", mine))
+
+
+hub = LiveHub(LIVE_REFRESH_SECONDS)
@@ -1,15 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
+import asyncio
+import orjson
 import traceback
 import logging
+import os
+import re
+import time
 
-from app.agent import get_agent
-from app.intent import detect_intent
-from app.tools import get_weather_json, compare_weather, score_city, summarize_forecast, weekend_summary, tomorrow_summary, hourly_lookup
-from app.schemas import AgentResponse, ReasoningStep
+from app.agent import get_agent, answer_with_data
+from app.intent import detect_intent, detect_intents
+from app.tools import get_weather_json, cached_weather, canonical_city, compare_weather, score_city, summarize_forecast, weekend_summary, tomorrow_summary, hourly_lookup, weather_cache_remaining, prefetch_cities, nearby_weather
+from app.windows import BEST_WINDOW_MAX_CITIES, best_windows
+from app.history import history
+from app.live import hub
+from app.pools import Overloaded, batch_pool, fast_pool, llm_pool
+from app.profiling import PROFILE_DIR, PROFILE_ID_RE, PROFILE_TOKEN, ProfiledRoute, ProfileMiddleware, list_profiles
+from app.schemas import AgentResponse, IntentResult
+from app.serialization import FastJSONResponse, agent_payload, cached_weather_response, make_step
 
 app = FastAPI(title="MeteoAgent")
+# Lets an active request profile see which threadpool thread runs the endpoint
+app.router.route_class = ProfiledRoute
+
+# Answer advice questions from pre-fetched data in one LLM call (ReAct agent as fallback)
+ADVICE_SINGLE_SHOT = os.getenv("ADVICE_SINGLE_SHOT", "1").lower() not in ("0", "false", "no")
 
 # Enable permissive CORS for production compatibility
 app.add_middleware(
@@ -17,7 +35,31 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+class _GZipExceptStreams(GZipMiddleware):
+    """GZipMiddleware that leaves streaming endpoints alone.
+
+    Older Starlette releases buffer event-stream and NDJSON chunks in the
+    compressor, which would hold back live events and batch lines.
+    """
+
+    STREAM_PATHS = frozenset({"/weather/stream", "/chat/batch"})
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app, **kwargs)
+        self.plain = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.STREAM_PATHS:
+            return await self.plain(scope, receive, send)
+        await super().__call__(scope, receive, send)
+
+
+# Compress larger bodies (multi-city batches); small single-city payloads stay plain
+app.add_middleware(_GZipExceptStreams, minimum_size=1024)
+# Opt-in sampling profiler (X-Profile header or PROFILE_SAMPLE_RATE); see app/profiling.py
+app.add_middleware(ProfileMiddleware)
 
 class ChatRequest(BaseModel):
     message: str
@@ -27,55 +69,129 @@ class WeatherBatchRequest(BaseModel):
     cities: list[str]
 
 
+class ChatBatchRequest(BaseModel):
+    messages: list[str]
+
+
+CHAT_BATCH_MAX = 5000
+
+# Intents _answer serves from the weather tools alone, without an LLM call
+_NO_LLM_INTENTS = {"comparison", "forecast", "current_weather", "nearby", "best_window", "unknown"}
+# Window length in a best-window question: "3-hour window", "4 hr slot" or
+# "for 6 hours". Horizons like "next 48 hours" or "within 24h" do not match.
+_WINDOW_HOURS_RE = re.compile(
+    r"\b(\d{1,2})\s*-?\s*(?:h|hrs?|hours?)\s+(?:window|slot|block|stretch|period)s?\b"
+    r"|\bfor\s+(?:an?\s+)?(\d{1,2})\s*(?:h|hrs?|hours?)\b"
+)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return FastJSONResponse(
+        {"detail": f"Server busy ({exc.pool}), retry later"},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _needs_llm(intent: IntentResult | None) -> bool:
+    return intent is not None and intent.intent not in _NO_LLM_INTENTS
+
+
 @app.post("/chat", response_model=AgentResponse)
-def chat(req: ChatRequest):
-    if not req.message.strip():
-        return AgentResponse(
-            answer=None,
-            reasoning=[],
-            intent="unknown",
-            cities=[],
-            confidence=0.0,
-            error="Please enter a valid question.",
-        )
+async def chat(req: ChatRequest):
+    # Intent detection is cheap and decides the pool: LLM-bound questions are
+    # admitted to the small llm pool (429 when full), the rest to the fast pool.
+    intent = await fast_pool.run(detect_intent, req.message) if req.message.strip() else None
+    pool = llm_pool if _needs_llm(intent) else fast_pool
+    # Responses are assembled from trusted values and returned pre-encoded, so
+    # they bypass AgentResponse validation; the model still documents the shape.
+    return FastJSONResponse(await pool.run(_answer, req.message, intent))
+
+
+@app.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest):
+    """Answer many messages, sharing city lookups across them.
+
+    Intents are detected for all messages first (each distinct city
+    candidate geocoded once), then weather and forecast for the union of
+    cities are fetched once in parallel, and every message is answered from
+    that shared data. Streams NDJSON lines {"index": i, "response": {...}}
+    in completion order.
+
+    The batch is admitted to the batch pool once, before streaming starts,
+    so a full pool answers 429; its messages then wait for a worker.
+    """
+    if len(req.messages) > CHAT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX} messages per batch")
+    messages = req.messages
+    intents = await batch_pool.run(detect_intents, messages)
+    cities = list(dict.fromkeys(c for it in intents if it for c in it.cities))
+    shared = await batch_pool.execute(prefetch_cities, cities)
+    # At most one worker's worth of messages per batch in the pool at a time
+    slots = asyncio.Semaphore(batch_pool.workers)
+
+    async def one(i: int):
+        async with slots:
+            try:
+                payload = await batch_pool.execute(_answer, messages[i], intents[i], shared)
+            except Exception:
+                logging.exception("Batch chat error")
+                it = intents[i] or IntentResult.model_construct(intent="unknown", cities=[], confidence=0.0, is_multi_city=False)
+                payload = agent_payload(it, [], error="Unable to process request.")
+        return i, payload
+
+    async def lines():
+        tasks = [asyncio.ensure_future(one(i)) for i in range(len(messages))]
+        try:
+            for done in asyncio.as_completed(tasks):
+                i, payload = await done
+                yield orjson.dumps({"index": i, "response": payload}) + b"\n"
+        finally:
+            # Client gone: don't answer the rest
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _answer(message: str, intent: IntentResult | None = None, shared_data: dict | None = None) -> dict:
+    """Answer one chat message as an AgentResponse-shaped dict.
 
-    intent = detect_intent(req.message)
+    /chat/batch passes the already detected intent and the weather/forecast
+    it prefetched for all messages (tools.prefetch_cities) via shared_data.
+    """
+    if not message.strip():
+        empty = IntentResult.model_construct(intent="unknown", cities=[], confidence=0.0, is_multi_city=False)
+        return agent_payload(empty, [], error="Please enter a valid question.")
+
+    if intent is None:
+        intent = detect_intent(message)
     reasoning_steps = [
-        ReasoningStep(step="intent_detection", detail=f"Intent={intent.intent}, Cities={intent.cities}, Multi={intent.is_multi_city}")
+        make_step("intent_detection", f"Intent={intent.intent}, Cities={intent.cities}, Multi={intent.is_multi_city}")
     ]
 
+    def reply(answer=None, error=None):
+        return agent_payload(intent, reasoning_steps, answer, error)
+
     # Comparison intent: require at least two cities, fetch each and score
     if intent.intent == "comparison":
         if len(intent.cities) < 2:
-            return AgentResponse(
-                answer="Please provide at least two cities to compare.",
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None,
-            )
+            return reply("Please provide at least two cities to compare.")
         weather_list = []
         for city in intent.cities:
             try:
                 w = get_weather_json(city)
                 if w:
                     weather_list.append(w)
-                    reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Weather received for {city}"))
+                    reasoning_steps.append(make_step("tool_result", f"Weather received for {city}"))
                 else:
-                    reasoning_steps.append(ReasoningStep(step="error", detail=f"No weather for {city}"))
+                    reasoning_steps.append(make_step("error", f"No weather for {city}"))
             except Exception as e:
-                reasoning_steps.append(ReasoningStep(step="error", detail=f"Failed for {city}: {str(e)}"))
+                reasoning_steps.append(make_step("error", f"Failed for {city}: {str(e)}"))
 
         if len(weather_list) < 2:
-            return AgentResponse(
-                answer="Unable to compare due to missing weather data.",
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None,
-            )
+            return reply("Unable to compare due to missing weather data.")
 
         # Score each city and pick winner
         scored = [(w, score_city(w)) for w in weather_list]
@@ -98,30 +214,16 @@ def chat(req: ChatRequest):
             f"Wind: {a['city']} {a['wind_kmh']} km/h vs {b['city']} {b['wind_kmh']} km/h\n"
         )
 
-        return AgentResponse(
-            answer=answer,
-            reasoning=reasoning_steps,
-            intent=intent.intent,
-            cities=intent.cities,
-            confidence=intent.confidence,
-            error=None,
-        )
+        return reply(answer)
 
     # Forecast intent: route to appropriate summarizer
     if intent.intent == "forecast":
         if not intent.cities:
-            return AgentResponse(
-                answer="Please specify a city for the forecast.",
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None,
-            )
+            return reply("Please specify a city for the forecast.")
 
         def summarize_for_message(city: str):
             t = intent
-            msg = req.message.lower()
+            msg = message.lower()
             if "weekend" in msg:
                 return weekend_summary(city)
             if "tomorrow" in msg:
@@ -146,30 +248,16 @@ def chat(req: ChatRequest):
             res = summarize_for_message(city)
             if isinstance(res, dict) and res.get("summary"):
                 summaries.append(f"{res.get('city', city)}: {res['summary']}")
-                reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Forecast summarized for {city}"))
+                reasoning_steps.append(make_step("tool_result", f"Forecast summarized for {city}"))
             else:
-                reasoning_steps.append(ReasoningStep(step="error", detail=f"Forecast unavailable for {city}"))
-
-        return AgentResponse(
-            answer="\n".join(summaries) if summaries else "Forecast unavailable.",
-            reasoning=reasoning_steps,
-            intent=intent.intent,
-            cities=intent.cities,
-            confidence=intent.confidence,
-            error=None,
-        )
+                reasoning_steps.append(make_step("error", f"Forecast unavailable for {city}"))
+
+        return reply("\n".join(summaries) if summaries else "Forecast unavailable.")
 
     # Direct route for current weather with cities
     if intent.intent == "current_weather":
         if not intent.cities:
-            return AgentResponse(
-                answer="Please specify a city.",
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None,
-            )
+            return reply("Please specify a city.")
         # If multiple cities are provided, behave like comparison using scores
         if len(intent.cities) >= 2:
             weather_list = []
@@ -178,20 +266,13 @@ def chat(req: ChatRequest):
                     w = get_weather_json(city)
                     if w:
                         weather_list.append(w)
-                        reasoning_steps.append(ReasoningStep(step="tool_result", detail=f"Weather received for {city}"))
+                        reasoning_steps.append(make_step("tool_result", f"Weather received for {city}"))
                     else:
-                        reasoning_steps.append(ReasoningStep(step="error", detail=f"No weather for {city}"))
+                        reasoning_steps.append(make_step("error", f"No weather for {city}"))
                 except Exception as e:
-                    reasoning_steps.append(ReasoningStep(step="error", detail=f"Failed for {city}: {str(e)}"))
+                    reasoning_steps.append(make_step("error", f"Failed for {city}: {str(e)}"))
             if len(weather_list) < 2:
-                return AgentResponse(
-                    answer="Unable to compare due to missing weather data.",
-                    reasoning=reasoning_steps,
-                    intent=intent.intent,
-                    cities=intent.cities,
-                    confidence=intent.confidence,
-                    error=None,
-                )
+                return reply("Unable to compare due to missing weather data.")
             a = weather_list[0]; b = weather_list[1]
             answer = (
                 f"Comparison summary:\n"
@@ -199,118 +280,341 @@ def chat(req: ChatRequest):
                 f"Humidity: {a['city']} {a['humidity']}% vs {b['city']} {b['humidity']}%\n"
                 f"Wind: {a['city']} {a['wind_kmh']} km/h vs {b['city']} {b['wind_kmh']} km/h\n"
             )
-            return AgentResponse(
-                answer=answer,
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None,
-            )
+            return reply(answer)
         # Single city
         city = intent.cities[0]
         try:
             w = get_weather_json(city)
-            return AgentResponse(
-                answer=(
-                    f"{w['city']}: {w['temp']}°C (feels {w['feels']}°C), "
-                    f"humidity {w['humidity']}%, wind {w['wind_kmh']} km/h, {w['condition']}"
-                ) if w else None,
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error=None if w else "Unable to fetch weather right now.",
+            if not w:
+                return reply(error="Unable to fetch weather right now.")
+            return reply(
+                f"{w['city']}: {w['temp']}°C (feels {w['feels']}°C), "
+                f"humidity {w['humidity']}%, wind {w['wind_kmh']} km/h, {w['condition']}"
             )
         except Exception as e:
             logging.exception("Weather tool error")
-            reasoning_steps.append(ReasoningStep(step="error", detail=f"Weather fetch failed for {city}: {str(e)}"))
-            return AgentResponse(
-                answer=None,
-                reasoning=reasoning_steps,
-                intent=intent.intent,
-                cities=intent.cities,
-                confidence=intent.confidence,
-                error="Unable to fetch weather right now.",
-            )
+            reasoning_steps.append(make_step("error", f"Weather fetch failed for {city}: {str(e)}"))
+            return reply(error="Unable to fetch weather right now.")
+
+    # Nearby intent: spatial index lookup around the first city
+    if intent.intent == "nearby":
+        center = intent.cities[0]
+        m = re.search(r"\bwithin\s+(\d+)\s*(?:km|kms|kilomet)", message.lower())
+        radius = float(m.group(1)) if m else None
+        reasoning_steps.append(make_step(
+            "tool_call",
+            f"Finding cities within {radius:.0f} km of {center}" if radius else f"Finding cities nearest to {center}",
+        ))
+        res = nearby_weather(center, radius_km=radius)
+        if not res:
+            reasoning_steps.append(make_step("error", f"Location unavailable for {center}"))
+            return reply(error=f"Unable to locate {center} right now.")
+        found = [r for r in res["results"] if r["weather"]]
+        reasoning_steps.append(make_step("tool_result", f"Weather received for {len(found)} nearby city(ies)"))
+        if not found:
+            return reply(f"No nearby cities with weather data found around {res['city']}.")
+        lines = [
+            f"- {r['city']} ({r['distance_km']:.0f} km): {r['weather']['temp']}°C, humidity {r['weather']['humidity']}%, "
+            f"wind {r['weather']['wind_kmh']} km/h, {r['weather']['condition']} (score {r['score']}/3)"
+            for r in found
+        ]
+        best = max(found, key=lambda r: (r["score"], -r["distance_km"]))
+        scope = f"within {radius:.0f} km of" if radius else "near"
+        return reply(f"Cities {scope} {res['city']}:\n" + "\n".join(lines) + f"\n\nBest right now: {best['city']}.")
+
+    # Best-window intent: score the forecast matrix of all mentioned cities
+    if intent.intent == "best_window":
+        m = _WINDOW_HOURS_RE.search(message.lower())
+        hours = int(m.group(1) or m.group(2)) if m else 6
+        reasoning_steps.append(make_step("tool_call", f"Scoring {hours}-hour forecast windows for {', '.join(intent.cities)}"))
+        res = best_windows(intent.cities, hours)
+        if not res:
+            reasoning_steps.append(make_step("error", "Forecast unavailable"))
+            return reply("Forecast unavailable.")
+        reasoning_steps.append(make_step("tool_result", f"Best windows found for {len(res['cities'])} city(ies)"))
+        return reply(res["summary"])
 
     # Unknown intent: friendly guidance
     if intent.intent == "unknown":
-        return AgentResponse(
-            answer="I can help with weather-related questions.",
-            reasoning=reasoning_steps,
-            intent=intent.intent,
-            cities=intent.cities,
-            confidence=intent.confidence,
-            error=None,
-        )
+        return reply("I can help with weather-related questions.")
+
+    # Advice with known cities: fetch everything up front, answer in one LLM call
+    if intent.intent == "advice" and intent.cities and ADVICE_SINGLE_SHOT:
+        reasoning_steps.append(make_step("tool_call", f"Prefetching weather and forecast for {', '.join(intent.cities)}"))
+        if shared_data is not None and all(c in shared_data for c in intent.cities):
+            city_data = {c: shared_data[c] for c in intent.cities}
+        else:
+            city_data = prefetch_cities(intent.cities)
+        for city, data in city_data.items():
+            if data["weather"] or data["forecast"].get("summary"):
+                reasoning_steps.append(make_step("tool_result", f"Data received for {city}"))
+            else:
+                reasoning_steps.append(make_step("error", f"No data for {city}"))
+        if any(d["weather"] or d["forecast"].get("summary") for d in city_data.values()):
+            try:
+                answer = answer_with_data(message, city_data, reasoning_steps)
+                reasoning_steps.append(make_step("final_answer", "Answer generated in a single LLM call"))
+                return reply(answer)
+            except Exception as e:
+                logging.exception("Single-shot answer failed")
+                reasoning_steps.append(make_step("error", f"Single-shot answer failed, falling back to agent: {e}"))
 
     # For other intents, use the LLM agent
     agent, agent_steps = get_agent()
-    reasoning_steps.extend(agent_steps)
 
     try:
-        response = agent.run(req.message)
-        reasoning_steps.append(ReasoningStep(step="final_answer", detail="Answer generated successfully"))
-        return AgentResponse(
-            answer=response,
-            reasoning=reasoning_steps,
-            intent=intent.intent,
-            cities=intent.cities,
-            confidence=intent.confidence,
-            error=None,
-        )
+        response = agent.run(message)
+        # The agent appends tool steps while running, so merge them afterwards
+        reasoning_steps.extend(agent_steps)
+        reasoning_steps.append(make_step("final_answer", "Answer generated successfully"))
+        return reply(response)
 
     except Exception as e:
         logging.exception("Chat error")
-        reasoning_steps.append(ReasoningStep(step="error", detail=str(e)))
-        return AgentResponse(
-            answer=None,
-            reasoning=reasoning_steps,
-            intent=intent.intent,
-            cities=intent.cities,
-            confidence=intent.confidence,
-            error="Unable to process request.",
-        )
+        reasoning_steps.extend(agent_steps)
+        reasoning_steps.append(make_step("error", str(e)))
+        return reply(error="Unable to process request.")
 
 
 @app.get("/debug/env")
 def debug_env():
-    import os
     return {
         "OPENROUTER_API_KEY_set": bool(os.getenv("OPENROUTER_API_KEY")),
         "WEATHER_API_KEY_set": bool(os.getenv("WEATHER_API_KEY"))
     }
 
 
+@app.get("/debug/pools")
+def debug_pools():
+    return {p.name: p.stats() for p in (fast_pool, llm_pool, batch_pool)}
+
+
+def _require_admin(token: str | None):
+    # Admin endpoints exist only when a PROFILE_TOKEN is configured
+    if not PROFILE_TOKEN or token != PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+@app.get("/admin/profiles")
+def admin_profiles(x_admin_token: str | None = Header(default=None)):
+    """Recent request profiles, newest first."""
+    _require_admin(x_admin_token)
+    return FastJSONResponse(list_profiles())
+
+
+@app.get("/admin/profiles/{profile_id}/{artifact}")
+def admin_profile_artifact(profile_id: str, artifact: str, x_admin_token: str | None = Header(default=None)):
+    """Download a profile artifact: flamegraph.svg or collapsed.txt."""
+    _require_admin(x_admin_token)
+    suffix = {"flamegraph.svg": ".svg", "collapsed.txt": ".collapsed.txt"}.get(artifact)
+    if not suffix or not PROFILE_ID_RE.match(profile_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = PROFILE_DIR / f"{profile_id}{suffix}"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media = "image/svg+xml" if suffix == ".svg" else "text/plain"
+    return FileResponse(path, media_type=media, filename=f"{profile_id}-{artifact}")
+
+
 @app.get("/weather")
-def get_weather(city: str):
+async def get_weather(city: str, if_none_match: str | None = Header(default=None)):
     """Return structured weather for a single city.
     Frontend uses this for rendering multi-city results.
+
+    Carries an ETag from the observation time and a max-age matching the
+    remaining weather cache lifetime; a matching If-None-Match yields 304.
+    Cache hits are answered on the event loop without touching a pool.
     """
     if not city or not city.strip():
         raise HTTPException(status_code=400, detail="Missing 'city' query param")
-    data = get_weather_json(city.strip())
+    data = cached_weather(city) or await fast_pool.run(get_weather_json, city.strip())
     if not data:
         raise HTTPException(status_code=404, detail="Weather unavailable")
-    return data
+    return cached_weather_response([data], if_none_match, weather_cache_remaining(city), single=True)
 
 
-@app.post("/weather/batch")
-def get_weather_batch(req: WeatherBatchRequest):
-    """Return structured weather for a list of cities (best-effort)."""
-    if not req.cities:
-        return []
-    out = []
+def _batch_names(cities: list[str]) -> list[str]:
+    names = []
     seen = set()
-    for c in req.cities:
+    for c in cities:
         name = (c or "").strip()
         if not name:
             continue
         if name.lower() in seen:
             continue
         seen.add(name.lower())
-        w = get_weather_json(name)
+        names.append(name)
+    return names
+
+
+def _weather_batch(names: list[str], if_none_match: str | None, records: list | None = None):
+    # records: weather already looked up for each name, so no fetch happens here
+    if records is None:
+        records = [get_weather_json(name) for name in names]
+    out = []
+    ages = []
+    for name, w in zip(names, records):
         if w:
             out.append(w)
+            ages.append(weather_cache_remaining(name))
+    # The batch is only fresh as long as its stalest member
+    max_age = min(ages, default=0)
+    return cached_weather_response(out, if_none_match, max_age)
+
+
+async def _weather_batch_dispatch(cities: list[str], if_none_match: str | None):
+    names = _batch_names(cities)
+    cached = [cached_weather(name) for name in names]
+    # All cached: answer inline from the records in hand; otherwise fetch on the fast pool
+    if all(cached):
+        return _weather_batch(names, if_none_match, cached)
+    return await fast_pool.run(_weather_batch, names, if_none_match)
+
+
+@app.get("/weather/nearby")
+async def get_weather_nearby(city: str, k: int = 5, radius_km: float | None = None):
+    """Current weather for the k nearest known cities, or all within radius_km."""
+    if not city or not city.strip():
+        raise HTTPException(status_code=400, detail="Missing 'city' query param")
+    if radius_km is not None and not 0 < radius_km <= 2000:
+        raise HTTPException(status_code=400, detail="'radius_km' must be between 0 and 2000")
+    res = await fast_pool.run(nearby_weather, city.strip(), k=k, radius_km=radius_km)
+    if not res:
+        raise HTTPException(status_code=404, detail="Location unavailable")
+    return FastJSONResponse(res)
+
+
+@app.get("/forecast/best-window")
+async def get_best_window(cities: str, hours: int = 6, top: int = 3):
+    """Best contiguous forecast windows of `hours` for comma-separated cities, per city and overall."""
+    names = list(dict.fromkeys(c.strip() for c in cities.split(",") if c.strip()))
+    if not names:
+        raise HTTPException(status_code=400, detail="Missing 'cities' query param")
+    if len(names) > BEST_WINDOW_MAX_CITIES:
+        raise HTTPException(status_code=400, detail=f"At most {BEST_WINDOW_MAX_CITIES} cities per query")
+    if not 1 <= hours <= 72:
+        raise HTTPException(status_code=400, detail="'hours' must be between 1 and 72")
+    res = await fast_pool.run(best_windows, names, hours, max(1, min(10, top)))
+    if not res:
+        raise HTTPException(status_code=404, detail="Forecast unavailable")
+    return FastJSONResponse(res)
+
+
+def _ws_cities(msg) -> list[str] | None:
+    """The cities of a {"cities": [str, ...]} message, or None if it has another shape."""
+    if not isinstance(msg, dict):
+        return None
+    cities = msg.get("cities")
+    if not isinstance(cities, list) or not all(isinstance(c, str) for c in cities):
+        return None
+    return cities
+
+
+_WS_BAD_MESSAGE = 'Expected {"cities": ["City", ...]}'
+
+
+@app.websocket("/ws/weather")
+async def weather_ws(ws: WebSocket):
+    """Live weather over WebSocket.
+
+    Client sends {"cities": [...]} (again at any time to change the list);
+    server sends {"type": "snapshot" | "update", "data": [weather, ...]},
+    with updates carrying only records whose observation changed. Any
+    other message closes the socket with 1003 (unsupported data).
+    """
+    await ws.accept()
+    try:
+        cities = _ws_cities(await ws.receive_json())
+    except (WebSocketDisconnect, ValueError):
+        return
+    if cities is None:
+        await ws.close(code=1003, reason=_WS_BAD_MESSAGE)
+        return
+    sub = await hub.subscribe(cities)
+
+    async def pump():
+        while True:
+            await ws.send_text((await sub.queue.get()).decode())
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            cities = _ws_cities(await ws.receive_json())
+            if cities is None:
+                sender.cancel()
+                await ws.close(code=1003, reason=_WS_BAD_MESSAGE)
+                break
+            await hub.update(sub, cities)
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        hub.unsubscribe(sub)
+        sender.cancel()
+
+
+@app.get("/weather/stream")
+async def weather_stream(cities: str):
+    """Live weather as Server-Sent Events for comma-separated cities (same events as /ws/weather)."""
+    names = cities.split(",")
+
+    async def events():
+        # Subscribe once streaming starts, so a client that never reads leaves nothing behind
+        sub = await hub.subscribe(names)
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"data: " + payload + b"\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/history")
+async def get_history(city: str, hours: int = 24, start: int | None = None, end: int | None = None, granularity: str = "raw"):
+    """Recorded observations for a city over the last `hours` (or [start, end] unix seconds).
+
+    granularity=raw returns every observation, granularity=day the daily rollups.
+    """
+    if history is None:
+        raise HTTPException(status_code=404, detail="Observation history is disabled")
+    if not city or not city.strip():
+        raise HTTPException(status_code=400, detail="Missing 'city' query param")
+    if granularity not in ("raw", "day"):
+        raise HTTPException(status_code=400, detail="'granularity' must be 'raw' or 'day'")
+    end = end if end is not None else int(time.time())
+    start = max(0, start if start is not None else end - max(1, hours) * 3600)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'start' must not be after 'end'")
+    return FastJSONResponse(await fast_pool.run(_history_payload, city.strip(), start, end, granularity))
+
+
+def _history_payload(city: str, start: int, end: int, granularity: str) -> dict:
+    # Recorded under the geocoder's name, whatever spelling was fetched
+    city = canonical_city(city)
+    out = {"city": city, "start": start, "end": end, "summary": history.aggregate(city, start, end)}
+    if granularity == "day":
+        out["days"] = history.daily(city, start, end)
+    else:
+        cols = history.range(city, start, end)
+        # float32 columns: round so JSON doesn't show 27.299999237060547
+        values = [cols["ts"].tolist()] + [cols[n].astype("f8").round(2).tolist() for n in ("temp", "feels", "humidity", "wind")]
+        out["points"] = [dict(zip(("ts", "temp", "feels", "humidity", "wind"), row)) for row in zip(*values)]
     return out
+
+
+@app.post("/weather/batch")
+async def get_weather_batch(req: WeatherBatchRequest, if_none_match: str | None = Header(default=None)):
+    """Return structured weather for a list of cities (best-effort)."""
+    return await _weather_batch_dispatch(req.cities or [], if_none_match)
+
+
+@app.get("/weather/batch")
+async def get_weather_batch_cached(cities: str, if_none_match: str | None = Header(default=None)):
+    """GET variant of /weather/batch (comma-separated cities) that browsers and CDNs can cache."""
+    return await _weather_batch_dispatch(cities.split(","), if_none_match)
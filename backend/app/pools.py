@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.profiling import run_registered
+
+
+class Overloaded(Exception):
+    """Raised when a pool's workers and queue are all taken; maps to HTTP 429."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} pool is at capacity")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class FetchExecutor:
+    """Thread pool for upstream fan-out (weather, forecast, geocoding) with a bounded queue.
+
+    submit() blocks the caller once `workers + queue_size` calls are in
+    flight, so a large fan-out feeds the pool at the rate it drains
+    instead of queueing everything ahead of later callers.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-fetch")
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def map(self, fn, items) -> list:
+        futures = [self.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+
+
+# The WorkloadPool whose worker is running the current call, if any
+_current_pool: contextvars.ContextVar = contextvars.ContextVar("workload_pool", default=None)
+
+
+class WorkloadPool:
+    """Fixed-size thread pool with a bounded admission queue.
+
+    At most `workers` calls run at once and `queue_size` more may wait;
+    beyond that run() fails fast with Overloaded instead of queueing
+    without bound. Admission is tracked on the event loop, so no lock.
+
+    Each pool also owns the FetchExecutor its calls fan out upstream
+    lookups on (see fetch_executor), so one workload's fan-out cannot
+    delay another's.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int, fetch_workers: int = 8):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of call duration, used to estimate Retry-After
+        self.avg_seconds = 1.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+        self.fetch = FetchExecutor(name, fetch_workers, 2 * fetch_workers)
+
+    def retry_after(self) -> int:
+        waves = max(1, self.admitted - self.workers + 1) / self.workers
+        return max(1, math.ceil(self.avg_seconds * waves))
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool, or raise Overloaded right away when it is full."""
+        if self.admitted >= self.capacity:
+            self.rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+        return await self.execute(fn, *args, **kwargs)
+
+    async def execute(self, fn, *args, **kwargs):
+        """Run fn on the pool without an admission check.
+
+        For follow-up work of a job already admitted through run(); it waits
+        for a worker instead of being shed, but still counts toward the load
+        later admissions see.
+        """
+        self.admitted += 1
+        start = time.perf_counter()
+        try:
+            # Carry contextvars (e.g. the active request profile) into the worker
+            ctx = contextvars.copy_context()
+            call = functools.partial(ctx.run, self._call, fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        finally:
+            self.admitted -= 1
+            self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - start)
+
+    def _call(self, fn, *args, **kwargs):
+        _current_pool.set(self)
+        return run_registered(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_ms": round(self.avg_seconds * 1000, 1),
+        }
+
+
+# LLM-bound chat holds a worker for seconds, so it gets a small pool and a
+# short queue; everything else (weather, geocoding, non-LLM chat) has its
+# own pool so an LLM surge cannot starve it. Batch jobs are isolated too.
+llm_pool = WorkloadPool(
+    "llm", int(os.getenv("LLM_POOL_SIZE", "8")), int(os.getenv("LLM_QUEUE_SIZE", "16")),
+    int(os.getenv("LLM_FETCH_SIZE", "8")),
+)
+fast_pool = WorkloadPool(
+    "fast", int(os.getenv("FAST_POOL_SIZE", "32")), int(os.getenv("FAST_QUEUE_SIZE", "512")),
+    int(os.getenv("FAST_FETCH_SIZE", "16")),
+)
+batch_pool = WorkloadPool(
+    "batch", int(os.getenv("BATCH_POOL_SIZE", "8")), int(os.getenv("BATCH_QUEUE_SIZE", "32")),
+    int(os.getenv("BATCH_FETCH_SIZE", "8")),
+)
+
+
+def fetch_executor() -> FetchExecutor:
+    """Fetch executor of the pool running the current call (the fast pool's outside any pool)."""
+    pool = _current_pool.get()
+    return (pool or fast_pool).fetch
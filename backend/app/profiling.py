@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from html import escape
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+
+# Profiles are opt-in: per request with `X-Profile: <PROFILE_TOKEN>`, or for a
+# random PROFILE_SAMPLE_RATE fraction of HTTP requests. Both need PROFILE_TOKEN,
+# which also guards the admin endpoints that list saved profiles. Without it,
+# the middleware passes every request straight through.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0
+PROFILE_KEEP = max(1, int(os.getenv("PROFILE_KEEP", "50")))  # the newest profile is always kept
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(Path(__file__).resolve().parents[1] / "data" / "profiles")))
+
+# Ids start with zero-padded time.time_ns(), so sorting names sorts by creation
+PROFILE_ID_RE = re.compile(r"^[0-9]{20}-[0-9a-f]{8}$")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("profile_session", default=None)
+
+
+class ProfileSession:
+    """Stack samples for the threads serving one request."""
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.threads: set[int] = set()
+        self.counts: Counter = Counter()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def add_thread(self, ident: int):
+        self.threads.add(ident)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class _Sampler:
+    """One daemon thread sampling the registered threads of all active sessions."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.sessions: set[ProfileSession] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, session: ProfileSession):
+        with self._lock:
+            self.sessions.add(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def stop(self, session: ProfileSession):
+        with self._lock:
+            self.sessions.discard(session)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                active = list(self.sessions)
+                if not active:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in active:
+                for ident in list(session.threads):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        session.counts[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler = _Sampler(PROFILE_INTERVAL)
+
+
+def profiling_configured() -> bool:
+    return bool(PROFILE_TOKEN)
+
+
+def _wants_profile(header_value: str | None) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    if header_value == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfileMiddleware:
+    """ASGI middleware: profile the request when asked to, then save artifacts.
+
+    Pure ASGI rather than BaseHTTPMiddleware so unprofiled requests pass
+    straight through, and streamed bodies are covered until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_configured():
+            return await self.app(scope, receive, send)
+        header = None
+        for k, v in scope.get("headers") or ():
+            if k == b"x-profile":
+                header = v.decode("latin-1")
+                break
+        if not _wants_profile(header):
+            return await self.app(scope, receive, send)
+
+        session = ProfileSession(scope.get("method", ""), scope.get("path", ""))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers") or []) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        token = _current.set(session)
+        _sampler.start(session)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _sampler.stop(session)
+            _current.reset(token)
+            session.duration = time.perf_counter() - session.started
+            try:
+                # SVG rendering and file writes stay off the event loop
+                await asyncio.to_thread(save_profile, session)
+            except Exception:
+                logging.exception("Saving profile failed")
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint registers its worker thread with an active profile.
+
+    Sync endpoints run on a threadpool thread that only the endpoint itself
+    can identify, so the registration happens inside the wrapped call.
+    Work dispatched through app.pools is registered the same way; other
+    executors (prefetch, agent tools) are not sampled. Async endpoints are
+    left alone: their thread is the shared event loop, whose samples would
+    be mostly idle select() and other requests' coroutines.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _register_thread(endpoint), **kwargs)
+
+
+def run_registered(fn, *args, **kwargs):
+    """Call fn, sampling the current thread for the active profile (if any) meanwhile."""
+    session = _current.get()
+    if session is None:
+        return fn(*args, **kwargs)
+    ident = threading.get_ident()
+    session.add_thread(ident)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Pool threads are reused by other requests afterwards
+        session.threads.discard(ident)
+
+
+def _register_thread(endpoint):
+    if inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        return run_registered(endpoint, *args, **kwargs)
+    return wrapper
+
+
+# -- artifacts ---------------------------------------------------------------
+
+def _color(name: str) -> str:
+    h = int(hashlib.md5(name.encode("utf-8")).hexdigest()[:6], 16)
+    return f"rgb({205 + h % 50},{(h >> 8) % 180 + 40},{(h >> 16) % 55})"
+
+
+def render_flamegraph(counts: Counter, title: str, width: int = 1200) -> str:
+    """Minimal self-contained SVG flamegraph (root at the bottom) from collapsed stacks."""
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, n in counts.items():
+        root["value"] += n
+        node = root
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"name": name, "value": 0, "children": {}})
+            node["value"] += n
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node["children"].values()), default=0)
+
+    row = 17
+    levels = depth(root)
+    height = (levels + 2) * row
+    total = max(root["value"], 1)
+    scale = (width - 20) / total
+    rects = []
+
+    def layout(node, x, level):
+        w = node["value"] * scale
+        if w < 0.3:
+            return
+        y = height - (level + 1) * row - 4
+        pct = 100.0 * node["value"] / total
+        name = node["name"]
+        text = name if w > 60 else ""
+        if len(text) * 7 > w:
+            text = text[: max(0, int(w / 7) - 2)] + ".."
+        label, text = escape(name), escape(text)
+        rects.append(
+            f'<g><title>{label} ({node["value"]} samples, {pct:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{_color(node["name"])}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row - 5}">{text}</text></g>'
+        )
+        cx = x
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            layout(child, cx, level + 1)
+            cx += child["value"] * scale
+
+    layout(root, 10, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fafafa"/>'
+        f'<text x="10" y="14" font-size="13">{escape(title)}</text>'
+        + "".join(rects)
+        + "</svg>"
+    )
+
+
+def save_profile(session: ProfileSession):
+    """Write <id>.collapsed.txt, <id>.svg and <id>.json, pruning to PROFILE_KEEP profiles."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    samples = sum(session.counts.values())
+    meta = {
+        "id": session.id,
+        "method": session.method,
+        "path": session.path,
+        "duration_ms": round(session.duration * 1000, 1),
+        "samples": samples,
+        "interval_ms": PROFILE_INTERVAL * 1000,
+    }
+    collapsed = "".join(f"{stack} {n}\n" for stack, n in sorted(session.counts.items()))
+    (PROFILE_DIR / f"{session.id}.collapsed.txt").write_text(collapsed, encoding="utf-8")
+    title = f"{session.method} {session.path} - {meta['duration_ms']} ms, {samples} samples"
+    (PROFILE_DIR / f"{session.id}.svg").write_text(render_flamegraph(session.counts, title), encoding="utf-8")
+    (PROFILE_DIR / f"{session.id}.json").write_text(json.dumps(meta), encoding="utf-8")
+    saved = sorted(p for p in PROFILE_DIR.glob("*.json") if PROFILE_ID_RE.match(p.stem))
+    for old in saved[: max(0, len(saved) - PROFILE_KEEP)]:
+        for suffix in (".json", ".svg", ".collapsed.txt"):
+            (PROFILE_DIR / f"{old.name[:-5]}{suffix}").unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    """Metadata of saved profiles, newest first."""
+    if not PROFILE_DIR.exists():
+        return []
+    out = []
+    for p in sorted(PROFILE_DIR.glob("*.json"), reverse=True):
+        if not PROFILE_ID_RE.match(p.stem):
+            continue
+        try:
+            out.append(json.loads(p.read_text(encoding="utf-8")))
+        except Exception:
+            continue
+    return out
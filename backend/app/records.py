@@ -0,0 +1,112 @@
+import sys
+from array import array
+
+
+class _Record:
+    """Read-only mapping-style access over __slots__ so callers written
+    against the old dict payloads (w["temp"], w.get("feels")) keep working."""
+
+    __slots__ = ()
+    _fields: tuple = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self._fields:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def to_dict(self) -> dict:
+        return {f: getattr(self, f) for f in self._fields}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class WeatherRecord(_Record):
+    """Current conditions for one city; condition strings are interned."""
+
+    __slots__ = ("city", "temp", "feels", "humidity", "visibility", "wind", "wind_kmh", "condition", "observed_at", "_json")
+    _fields = ("city", "temp", "feels", "humidity", "visibility", "wind", "wind_kmh", "condition", "observed_at")
+
+    def __init__(self, city, temp, feels, humidity, visibility, wind, wind_kmh, condition, observed_at):
+        self.city = city
+        self.temp = temp
+        self.feels = feels
+        self.humidity = humidity
+        self.visibility = visibility
+        self.wind = wind
+        self.wind_kmh = wind_kmh
+        self.condition = sys.intern(condition)
+        self.observed_at = observed_at
+        # Encoded JSON, filled lazily by app.serialization at the API edge
+        self._json = None
+
+
+class ForecastBlock(_Record):
+    """One 3-hour forecast block, materialized on demand from a Forecast."""
+
+    __slots__ = ("dt_txt", "temp", "humidity", "wind", "wind_kmh", "condition")
+    _fields = ("dt_txt", "temp", "humidity", "wind", "wind_kmh", "condition")
+
+    def __init__(self, dt_txt, temp, humidity, wind, wind_kmh, condition):
+        self.dt_txt = dt_txt
+        self.temp = temp
+        self.humidity = humidity
+        self.wind = wind
+        self.wind_kmh = wind_kmh
+        self.condition = condition
+
+
+class Forecast:
+    """Column-oriented 5-day/3-hour forecast for one city.
+
+    Numbers live in typed arrays and the timestamp/condition strings are
+    interned, so they are shared across every cached city's forecast.
+    """
+
+    __slots__ = ("city", "dt_txt", "temp", "humidity", "wind_ms", "condition")
+
+    def __init__(self, city: str):
+        self.city = city
+        self.dt_txt: list[str] = []
+        self.temp = array("d")
+        self.humidity = array("B")
+        self.wind_ms = array("d")
+        self.condition: list[str] = []
+
+    def append(self, dt_txt: str, temp: float, humidity: int, wind_ms: float, condition: str):
+        self.dt_txt.append(sys.intern(dt_txt))
+        self.temp.append(temp)
+        self.humidity.append(max(0, min(255, humidity)))
+        self.wind_ms.append(wind_ms)
+        self.condition.append(sys.intern(condition))
+
+    def freeze(self):
+        """Trim list over-allocation once the forecast is fully built."""
+        self.dt_txt = tuple(self.dt_txt)
+        self.condition = tuple(self.condition)
+        return self
+
+    def __len__(self):
+        return len(self.temp)
+
+    def block(self, i: int) -> ForecastBlock:
+        w = self.wind_ms[i]
+        return ForecastBlock(self.dt_txt[i], self.temp[i], self.humidity[i], round(w, 1), round(w * 3.6, 1), self.condition[i])
+
+    def __iter__(self):
+        for i in range(len(self.temp)):
+            yield self.block(i)
+
+    def to_dict(self) -> dict:
+        return {"city": self.city, "forecast": [b.to_dict() for b in self]}
+
+    def __repr__(self):
+        return repr(self.to_dict())
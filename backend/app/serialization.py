@@ -0,0 +1,97 @@
+import hashlib
+
+import orjson
+from fastapi.responses import Response
+
+from app.records import WeatherRecord
+from app.schemas import IntentResult, ReasoningStep
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson; accepts pre-encoded bytes as-is."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return orjson.dumps(content, default=_to_json)
+
+
+def _to_json(obj):
+    # Records (app.records) are converted only here, at the API edge
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+    return to_dict()
+
+
+def encode_weather(record: WeatherRecord) -> bytes:
+    """Return JSON bytes for a weather record, encoding it at most once.
+
+    Records are shared through the weather cache and never mutated, so the
+    bytes are memoized on the record itself.
+    """
+    data = record._json
+    if data is None:
+        data = record._json = orjson.dumps(record.to_dict())
+    return data
+
+
+def encode_weather_list(records: list) -> bytes:
+    """Splice cached per-record bytes into a JSON array without re-encoding."""
+    return b"[" + b",".join(encode_weather(r) for r in records) + b"]"
+
+
+def weather_etag(records: list) -> str:
+    """Weak ETag derived from each record's city and upstream observation time.
+
+    Weak because the same representation may be served gzip-compressed.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for r in records:
+        h.update(f"{r.city}@{r.observed_at};".encode("utf-8"))
+    return f'W/"{h.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Evaluate an If-None-Match header using weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+
+def cached_weather_response(records: list, if_none_match: str | None, max_age: int, single: bool = False) -> Response:
+    """Weather response carrying ETag/Cache-Control; 304 when the client copy is current."""
+    etag = weather_etag(records)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max(0, int(max_age))}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    body = encode_weather(records[0]) if single else encode_weather_list(records)
+    return FastJSONResponse(body, headers=headers)
+
+
+def make_step(step: str, detail: str | None = None) -> ReasoningStep:
+    """Build a ReasoningStep from trusted values, skipping validation."""
+    return ReasoningStep.model_construct(step=step, detail=detail)
+
+
+def agent_payload(intent: IntentResult, reasoning: list, answer=None, error=None) -> dict:
+    """Plain-dict equivalent of AgentResponse for the fast response path."""
+    return {
+        "answer": answer,
+        "reasoning": [{"step": s.step, "detail": s.detail} for s in reasoning],
+        "intent": intent.intent,
+        "cities": intent.cities,
+        "confidence": intent.confidence,
+        "error": error,
+    }
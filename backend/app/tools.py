@@ -1,7 +1,23 @@
 import os
+import time
 import requests
 from datetime import datetime, timedelta
 
+from app.cache import TTLCache
+from app.geo import city_index
+from app.history import history, record_observation
+from app.pools import fetch_executor
+from app.records import Forecast, WeatherRecord
+
+# Current conditions change slowly upstream; reuse fetched records for a few minutes
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "300"))
+_weather_cache = TTLCache(WEATHER_CACHE_TTL)
+# Forecast runs are published every few hours; coordinates never change
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", "1800"))
+_forecast_cache = TTLCache(FORECAST_CACHE_TTL)
+_coords_cache = TTLCache(24 * 3600, maxsize=50000)
+_candidate_cache = TTLCache(24 * 3600, maxsize=50000)
+
 
 def get_weather(city: str) -> str:
     """Backward-compatible string weather output using structured data under the hood."""
@@ -18,7 +34,9 @@ def search_city_candidates(query: str):
     """Return a canonical city name if the query matches a city via
     OpenWeather's Geo API; otherwise return None.
 
-    This validates arbitrary inputs and supports global cities.
+    This validates arbitrary inputs and supports global cities. Answers
+    (including "no such city") are cached, so repeated candidates across
+    messages are geocoded once.
     """
     api_key = os.getenv("WEATHER_API_KEY")
     if not api_key:
@@ -28,6 +46,10 @@ def search_city_candidates(query: str):
     if len(q) < 3:
         return None
 
+    cached = _candidate_cache.get(q.lower())
+    if cached is not None:
+        return cached or None
+
     url = "https://api.openweathermap.org/geo/1.0/direct"
     params = {
         "q": q,
@@ -48,17 +70,37 @@ def search_city_candidates(query: str):
     except Exception:
         return None
 
-    if not data:
-        return None
-
-    # Return the canonical city name from the first match
-    name = data[0].get("name")
+    # Return the canonical city name from the first match ("" caches a miss)
+    name = (data[0].get("name") if data else None) or ""
+    _candidate_cache.set(q.lower(), name)
     return name if name else None
+
+
+def canonical_city(city: str) -> str:
+    """Geocoder name for a city query ("pune", "Pune, IN" -> "Pune").
+
+    Falls back to the title-cased part before the first comma, so the same
+    query always maps to the same name. Used to key observation history.
+    """
+    name = (city or "").split(",")[0].strip()
+    return search_city_candidates(city) or search_city_candidates(name) or name.title()
+
+
+def resolve_city_candidates(queries: list[str]) -> dict:
+    """Resolve distinct candidate strings concurrently; results also land in the candidate cache."""
+    distinct = list(dict.fromkeys(q for q in queries if q))
+    return dict(zip(distinct, fetch_executor().map(search_city_candidates, distinct)))
+
+
 FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
 
 
 def get_coordinates(city: str):
     """Resolve a city to (lat, lon) using OpenWeather Geo API."""
+    key = (city or "").strip().lower()
+    cached = _coords_cache.get(key)
+    if cached is not None:
+        return cached
     api_key = os.getenv("WEATHER_API_KEY")
     if not api_key:
         return None
@@ -80,14 +122,24 @@ def get_coordinates(city: str):
     lon = data[0].get("lon")
     if lat is None or lon is None:
         return None
-    return float(lat), float(lon)
+    coords = (float(lat), float(lon))
+    _coords_cache.set(key, coords)
+    # Every resolved city becomes a candidate for nearby queries
+    city_index.add(data[0].get("name") or city.title(), *coords)
+    return coords
 
 
 def get_forecast(city: str):
     """Fetch 5-day/3-hour forecast blocks for a city.
 
-    Returns { city, forecast: [ { dt_txt, temp, humidity, wind, wind_kmh, condition } ] }
+    Returns a Forecast (columnar; iterate for ForecastBlock records with
+    dt_txt, temp, humidity, wind, wind_kmh, condition), or None.
+    Cached for FORECAST_CACHE_TTL seconds.
     """
+    key = (city or "").strip().lower()
+    cached = _forecast_cache.get(key)
+    if cached is not None:
+        return cached
     coords = get_coordinates(city)
     if not coords:
         return None
@@ -107,7 +159,7 @@ def get_forecast(city: str):
     except Exception:
         return None
     lst = data.get("list") or []
-    forecast = []
+    forecast = Forecast(city.title())
     for entry in lst:
         try:
             dt_txt = entry["dt_txt"]
@@ -117,17 +169,12 @@ def get_forecast(city: str):
             cond = str(entry["weather"][0]["main"]).lower()
         except Exception:
             continue
-        forecast.append({
-            "dt_txt": dt_txt,
-            "temp": temp,
-            "humidity": humidity,
-            "wind": round(wind_ms, 1),
-            "wind_kmh": round(wind_ms * 3.6, 1),
-            "condition": cond,
-        })
-    if not forecast:
+        forecast.append(dt_txt, temp, humidity, wind_ms, cond)
+    if not len(forecast):
         return None
-    return {"city": city.title(), "forecast": forecast}
+    forecast.freeze()
+    _forecast_cache.set(key, forecast)
+    return forecast
 
 
 def summarize_forecast(city: str):
@@ -135,16 +182,16 @@ def summarize_forecast(city: str):
     raw = get_forecast(city)
     if not raw:
         return {"error": f"Forecast unavailable for {city}"}
-    temps = [x["temp"] for x in raw["forecast"]]
-    hums = [x["humidity"] for x in raw["forecast"]]
+    temps = raw.temp
+    hums = raw.humidity
     avg_temp = sum(temps) / len(temps)
     avg_hum = sum(hums) / len(hums)
     high = max(temps)
     low = min(temps)
     return {
-        "city": raw["city"],
+        "city": raw.city,
         "summary": f"Avg Temp: {avg_temp:.1f}°C, High: {high:.1f}°C, Low: {low:.1f}°C; Avg Humidity: {avg_hum:.0f}%",
-        "data_points": len(raw["forecast"]),
+        "data_points": len(raw),
         "raw": raw,
     }
 
@@ -155,7 +202,7 @@ def weekend_summary(city: str):
     if not raw:
         return {"error": f"Forecast unavailable for {city}"}
     weekend = []
-    for x in raw["forecast"]:
+    for x in raw:
         try:
             dt = datetime.strptime(x["dt_txt"], "%Y-%m-%d %H:%M:%S")
         except Exception:
@@ -163,7 +210,7 @@ def weekend_summary(city: str):
         if dt.weekday() in (5, 6):
             weekend.append(x)
     if not weekend:
-        return {"city": raw["city"], "summary": "No weekend data in forecast window", "data_points": 0, "raw": {"forecast": []}}
+        return {"city": raw.city, "summary": "No weekend data in forecast window", "data_points": 0, "raw": {"forecast": []}}
     temps = [x["temp"] for x in weekend]
     hums = [x["humidity"] for x in weekend]
     avg_temp = sum(temps) / len(temps)
@@ -171,7 +218,7 @@ def weekend_summary(city: str):
     high = max(temps)
     low = min(temps)
     return {
-        "city": raw["city"],
+        "city": raw.city,
         "summary": f"Weekend Avg Temp: {avg_temp:.1f}°C (High {high:.1f}°C / Low {low:.1f}°C), Avg Humidity {avg_hum:.0f}%",
         "data_points": len(weekend),
         "raw": {"forecast": weekend},
@@ -187,7 +234,7 @@ def tomorrow_summary(city: str):
     # pick nearest block to 12:00-15:00
     target_hours = {12, 15}
     candidates = []
-    for x in raw["forecast"]:
+    for x in raw:
         try:
             dt = datetime.strptime(x["dt_txt"], "%Y-%m-%d %H:%M:%S")
         except Exception:
@@ -195,12 +242,12 @@ def tomorrow_summary(city: str):
         if dt.date() == tomorrow:
             candidates.append((x, dt))
     if not candidates:
-        return {"city": raw["city"], "summary": "No tomorrow data available", "data_points": 0, "raw": {"forecast": []}}
+        return {"city": raw.city, "summary": "No tomorrow data available", "data_points": 0, "raw": {"forecast": []}}
     # choose block with hour closest to 13:00
     best = min(candidates, key=lambda t: min(abs(t[1].hour - h) for h in target_hours))
     x = best[0]
     return {
-        "city": raw["city"],
+        "city": raw.city,
         "summary": f"Tomorrow near midday: {x['temp']:.1f}°C, {x['humidity']}% humidity, wind {x['wind_kmh']:.1f} km/h, {x['condition']}",
         "data_points": 1,
         "raw": {"forecast": [x]},
@@ -217,7 +264,7 @@ def hourly_lookup(city: str, target_hour: int):
     now = datetime.utcnow()
     limit = now + timedelta(hours=36)
     candidates = []
-    for x in raw["forecast"]:
+    for x in raw:
         try:
             dt = datetime.strptime(x["dt_txt"], "%Y-%m-%d %H:%M:%S")
         except Exception:
@@ -225,11 +272,11 @@ def hourly_lookup(city: str, target_hour: int):
         if now <= dt <= limit:
             candidates.append((x, dt))
     if not candidates:
-        return {"city": raw["city"], "summary": "No near-term forecast block found", "data_points": 0, "raw": {"forecast": []}}
+        return {"city": raw.city, "summary": "No near-term forecast block found", "data_points": 0, "raw": {"forecast": []}}
     best = min(candidates, key=lambda t: abs(t[1].hour - target_hour))
     x = best[0]
     return {
-        "city": raw["city"],
+        "city": raw.city,
         "summary": f"Around {best[1].strftime('%Y-%m-%d %H:%M')}: {x['temp']:.1f}°C, {x['humidity']}% humidity, wind {x['wind_kmh']:.1f} km/h, {x['condition']}",
         "data_points": 1,
         "raw": {"forecast": [x]},
@@ -239,7 +286,7 @@ def hourly_lookup(city: str, target_hour: int):
 def get_weather_json(city: str):
     """Return structured weather for a city using OpenWeather current weather API.
 
-    Output example:
+    Returns a WeatherRecord (supports w["temp"] / w.get(...)); fields as in:
     {
       "city": "Nagpur",
       "temp": 29.0,
@@ -248,9 +295,18 @@ def get_weather_json(city: str):
       "visibility": 6.0,  # km
       "wind": 3.0,        # m/s
       "wind_kmh": 10.8,   # km/h
-      "condition": "mist"
+      "condition": "mist",
+      "observed_at": 1717000000  # upstream observation time (unix seconds)
     }
+
+    Successful lookups are cached for WEATHER_CACHE_TTL seconds; callers must
+    treat the returned record as read-only since it is shared between requests.
     """
+    key = (city or "").strip().lower()
+    cached = _weather_cache.get(key)
+    if cached is not None:
+        return cached
+
     api_key = os.getenv("WEATHER_API_KEY")
     if not api_key:
         return None
@@ -279,21 +335,148 @@ def get_weather_json(city: str):
         visibility_m = float(data.get("visibility", 0))
         wind_ms = float(data.get("wind", {}).get("speed", 0.0))
         condition = str(data.get("weather", [{"main": "unknown"}])[0].get("main", "unknown")).lower()
+        observed_at = int(data.get("dt") or time.time())
     except Exception:
         return None
 
+    record = WeatherRecord(
+        city=city.title(),
+        temp=temp,
+        feels=feels,
+        humidity=humidity,
+        visibility=round(visibility_m / 1000.0, 1),
+        wind=round(wind_ms, 1),
+        wind_kmh=round(wind_ms * 3.6, 1),
+        condition=condition,
+        observed_at=observed_at,
+    )
+    _weather_cache.set(key, record)
+    record_observation(record, canonical_city(city))
+    return record
+
+
+def cached_weather(city: str):
+    """The cached WeatherRecord for city, or None; never calls upstream."""
+    return _weather_cache.get((city or "").strip().lower())
+
+
+def weather_cache_remaining(city: str) -> int:
+    """Seconds a cached weather record for city stays fresh (0 if not cached)."""
+    left = _weather_cache.remaining((city or "").strip().lower())
+    return int(left) if left else 0
+
+
+def prefetch_cities(cities: list[str]) -> dict:
+    """Fetch current weather and forecast summary for each city concurrently.
+
+    Returns { city: { "weather": WeatherRecord | None, "forecast": summary dict } }
+    """
+    if not cities:
+        return {}
+    pool = fetch_executor()
+    weather = {c: pool.submit(get_weather_json, c) for c in cities}
+    forecast = {c: pool.submit(summarize_forecast, c) for c in cities}
+    out = {}
+    for c in cities:
+        try:
+            w = weather[c].result()
+        except Exception:
+            w = None
+        try:
+            f = forecast[c].result()
+        except Exception:
+            f = {"error": f"Forecast unavailable for {c}"}
+        out[c] = {"weather": w, "forecast": f}
+    return out
+
+
+def get_forecasts(cities: list[str]) -> dict:
+    """Fetch forecasts for several cities concurrently: { city: Forecast | None }."""
+    pool = fetch_executor()
+    futures = {c: pool.submit(get_forecast, c) for c in dict.fromkeys(cities)}
+    out = {}
+    for c, fut in futures.items():
+        try:
+            out[c] = fut.result()
+        except Exception:
+            out[c] = None
+    return out
+
+
+NEARBY_MAX_RESULTS = 25
+
+
+def nearby_weather(city: str, k: int = 5, radius_km: float | None = None):
+    """Current weather for cities near `city` from the spatial index.
+
+    With radius_km, returns every indexed city within that distance (capped
+    at NEARBY_MAX_RESULTS); otherwise the k nearest. Weather is fetched
+    concurrently and served from the weather cache when warm.
+
+    Returns { city, lat, lon, results: [ { city, distance_km, score, weather } ] } or None.
+    """
+    coords = get_coordinates(city)
+    if not coords:
+        return None
+    lat, lon = coords
+    # Skip the queried city itself: by name, or by position when it is indexed
+    # under a different canonical name (e.g. an alias geocoded next to a seed)
+    own = ((city or "").strip(),)
+    if radius_km is not None:
+        hits = city_index.within(lat, lon, radius_km, exclude=own, min_km=2.0)[:NEARBY_MAX_RESULTS]
+    else:
+        hits = city_index.nearest(lat, lon, min(max(1, k), NEARBY_MAX_RESULTS), exclude=own, min_km=2.0)
+    pool = fetch_executor()
+    futures = [pool.submit(get_weather_json, name) for name, _ in hits]
+    results = []
+    for (name, dist), fut in zip(hits, futures):
+        try:
+            w = fut.result()
+        except Exception:
+            w = None
+        results.append({
+            "city": name,
+            "distance_km": dist,
+            "score": score_city(w) if w else None,
+            "weather": w,
+        })
+    return {"city": city.title(), "lat": lat, "lon": lon, "results": results}
+
+
+def summarize_history(city: str, days: int = 1):
+    """Aggregate recorded observations for the last `days` days plus daily rollups."""
+    if history is None:
+        return {"error": "Observation history is disabled"}
+    days = max(1, min(90, int(days)))
+    city = canonical_city(city)
+    end = int(time.time())
+    start = end - days * 86400
+    agg = history.aggregate(city, start, end)
+    if not agg["count"]:
+        return {"error": f"No recorded history for {city} yet"}
+    daily = history.daily(city, start, end)
+    per_day = "; ".join(
+        f"{d['date']} avg {d['temp_avg']}°C ({d['temp_min']}-{d['temp_max']}), {d['humidity_avg']:.0f}%"
+        for d in daily
+    )
     return {
-        "city": city.title(),
-        "temp": temp,
-        "feels": feels,
-        "humidity": humidity,
-        "visibility": round(visibility_m / 1000.0, 1),
-        "wind": round(wind_ms, 1),
-        "wind_kmh": round(wind_ms * 3.6, 1),
-        "condition": condition,
+        "city": city,
+        "summary": (
+            f"Last {days} day(s), {agg['count']} observations: avg {agg['temp_avg']}°C "
+            f"(low {agg['temp_min']}°C / high {agg['temp_max']}°C), avg humidity {agg['humidity_avg']:.0f}%, "
+            f"avg wind {agg['wind_avg']} m/s. Daily: {per_day}"
+        ),
+        "aggregate": agg,
+        "daily": daily,
     }
 
 
+# score_city thresholds; windows.score_matrix applies the same ones to forecasts
+COMFORT_TEMP_MIN, COMFORT_TEMP_MAX = 20, 32
+COMFORT_HUMIDITY_MAX = 65
+COMFORT_WIND_MAX_MS = 8
+
+
 def score_city(w: dict) -> int:
     """Travel-friendly scoring (Option A):
     +1: temp in [20, 32]
@@ -301,11 +484,11 @@ def score_city(w: dict) -> int:
     +1: wind (m/s) <= 8 (~28.8 km/h)
     """
     score = 0
-    if 20 <= w.get("temp", 100) <= 32:
+    if COMFORT_TEMP_MIN <= w.get("temp", 100) <= COMFORT_TEMP_MAX:
         score += 1
-    if w.get("humidity", 101) <= 65:
+    if w.get("humidity", 101) <= COMFORT_HUMIDITY_MAX:
         score += 1
-    if w.get("wind", 100) <= 8:
+    if w.get("wind", 100) <= COMFORT_WIND_MAX_MS:
         score += 1
     return score
 
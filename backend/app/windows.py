@@ -0,0 +1,164 @@
+import math
+import time
+
+import numpy as np
+
+from app.tools import COMFORT_HUMIDITY_MAX, COMFORT_TEMP_MAX, COMFORT_TEMP_MIN, COMFORT_WIND_MAX_MS, get_forecasts
+
+BLOCK_HOURS = 3
+BEST_WINDOW_MAX_CITIES = 10
+_STEP = np.timedelta64(BLOCK_HOURS, "h")
+
+
+def forecast_matrix(cities: list[str], now: int | None = None) -> dict | None:
+    """Align cached forecasts into cities × 3-hour-block matrices.
+
+    Columns are a regular grid of block start times (UTC, like dt_txt) from
+    the earliest to the latest block of any city; cells a city's forecast
+    does not cover are NaN (None for condition). Blocks starting before
+    `now` (unix seconds, default the current time) are dropped, since a
+    cached forecast may be up to FORECAST_CACHE_TTL old. Returns None when
+    no city has a forecast.
+    """
+    forecasts = {c: f for c, f in get_forecasts(cities).items() if f}
+    if not forecasts:
+        return None
+    names = list(forecasts)
+    stamps = [np.array(forecasts[c].dt_txt, dtype="datetime64[s]") for c in names]
+    start = min(t.min() for t in stamps)
+    positions = [((t - start) // _STEP).astype(np.intp) for t in stamps]
+    n = int(max(p.max() for p in positions)) + 1
+    shape = (len(names), n)
+    temp = np.full(shape, np.nan)
+    humidity = np.full(shape, np.nan)
+    wind = np.full(shape, np.nan)
+    condition = np.full(shape, None, dtype=object)
+    for i, (c, cols) in enumerate(zip(names, positions)):
+        f = forecasts[c]
+        # Zero-copy views over the Forecast's typed arrays
+        temp[i, cols] = np.frombuffer(f.temp, dtype=np.float64)
+        humidity[i, cols] = np.frombuffer(f.humidity, dtype=np.uint8)
+        wind[i, cols] = np.frombuffer(f.wind_ms, dtype=np.float64)
+        condition[i, cols] = f.condition
+    times = start + np.arange(n) * _STEP
+    first = int(np.searchsorted(times, np.datetime64(int(time.time() if now is None else now), "s")))
+    return {
+        "cities": [forecasts[c].city for c in names],
+        "missing": [c for c in cities if c not in forecasts],
+        "times": times[first:],
+        "temp": temp[:, first:],
+        "humidity": humidity[:, first:],
+        "wind": wind[:, first:],
+        "condition": condition[:, first:],
+    }
+
+
+def score_matrix(temp: np.ndarray, humidity: np.ndarray, wind: np.ndarray) -> np.ndarray:
+    """tools.score_city applied to every cell at once: 0-3, NaN where there is no block."""
+    score = ((temp >= COMFORT_TEMP_MIN) & (temp <= COMFORT_TEMP_MAX)).astype(np.float64)
+    score += humidity <= COMFORT_HUMIDITY_MAX
+    score += wind <= COMFORT_WIND_MAX_MS
+    score[np.isnan(temp)] = np.nan
+    return score
+
+
+def window_scores(score: np.ndarray, blocks: int) -> np.ndarray:
+    """Mean score of every run of `blocks` consecutive blocks.
+
+    Column j covers blocks j .. j + blocks - 1; runs with a missing block are NaN.
+    """
+    valid = ~np.isnan(score)
+    pad = np.zeros((score.shape[0], 1))
+    total = np.concatenate([pad, np.cumsum(np.where(valid, score, 0.0), axis=1)], axis=1)
+    count = np.concatenate([pad, np.cumsum(valid, axis=1)], axis=1)
+    sums = total[:, blocks:] - total[:, :-blocks]
+    full = (count[:, blocks:] - count[:, :-blocks]) == blocks
+    return np.where(full, sums / blocks, np.nan)
+
+
+def _fmt(t) -> str:
+    return str(t.astype("datetime64[m]")).replace("T", " ")
+
+
+def _window(m: dict, i: int, j: int, blocks: int, score: float) -> dict:
+    span = slice(j, j + blocks)
+    temp = m["temp"][i, span]
+    return {
+        "city": m["cities"][i],
+        "start": _fmt(m["times"][j]),
+        "end": _fmt(m["times"][j + blocks - 1] + _STEP),
+        "score": round(float(score), 2),
+        "temp_avg": round(float(temp.mean()), 1),
+        "temp_min": round(float(temp.min()), 1),
+        "temp_max": round(float(temp.max()), 1),
+        "humidity_avg": round(float(m["humidity"][i, span].mean()), 0),
+        "wind_kmh_avg": round(float(m["wind"][i, span].mean()) * 3.6, 1),
+        "conditions": list(dict.fromkeys(m["condition"][i, span])),
+    }
+
+
+def _describe(w: dict) -> str:
+    return (
+        f"{w['city']} {w['start']} to {w['end']} UTC (score {w['score']:g}/3): "
+        f"{w['temp_min']:.0f}-{w['temp_max']:.0f}°C, {w['humidity_avg']:.0f}% humidity, "
+        f"wind {w['wind_kmh_avg']} km/h, {', '.join(w['conditions'])}"
+    )
+
+
+def best_windows(cities: list[str], hours: int = 6, top: int = 3) -> dict | None:
+    """Best contiguous forecast windows of `hours` per city and across all cities.
+
+    Windows are ranked by their mean score_city-style score (earliest first
+    on ties). `best` holds the top windows overall, never two overlapping
+    windows of the same city. Times are UTC block boundaries, and only
+    blocks that have not started yet are considered. Cities past
+    BEST_WINDOW_MAX_CITIES are not scored and are listed in `skipped`.
+
+    Returns { hours, cities: [ {city, window} ], best: [window], missing, skipped, summary } or None.
+    """
+    names = list(dict.fromkeys(c.strip() for c in cities if c and c.strip()))
+    cities, skipped = names[:BEST_WINDOW_MAX_CITIES], names[BEST_WINDOW_MAX_CITIES:]
+    m = forecast_matrix(cities)
+    if m is None:
+        return None
+    blocks = max(1, math.ceil(hours / BLOCK_HOURS))
+    scores = window_scores(score_matrix(m["temp"], m["humidity"], m["wind"]), blocks)
+
+    per_city = []
+    for i, city in enumerate(m["cities"]):
+        row = scores[i]
+        if np.isnan(row).all():
+            per_city.append({"city": city, "window": None})
+            continue
+        j = int(np.nanargmax(row))
+        per_city.append({"city": city, "window": _window(m, i, j, blocks, row[j])})
+
+    # Rank every valid window at once: score descending, then start time
+    rows, cols = np.nonzero(~np.isnan(scores))
+    flat = scores[rows, cols]
+    best, taken = [], {}
+    for k in np.lexsort((cols, -flat)):
+        i, j = int(rows[k]), int(cols[k])
+        if any(abs(j - other) < blocks for other in taken.get(i, ())):
+            continue
+        taken.setdefault(i, []).append(j)
+        best.append(_window(m, i, j, blocks, flat[k]))
+        if len(best) >= top:
+            break
+
+    if best:
+        lines = [f"Best overall: {_describe(best[0])}", "Best per city:"]
+        lines += [f"- {_describe(p['window'])}" for p in per_city if p["window"]]
+        summary = "\n".join(lines)
+    else:
+        summary = f"No upcoming {blocks * BLOCK_HOURS}-hour window is fully covered by the forecast"
+    if skipped:
+        summary += f"\nNot scored (limit {BEST_WINDOW_MAX_CITIES} cities): {', '.join(skipped)}"
+    return {
+        "hours": blocks * BLOCK_HOURS,
+        "cities": per_city,
+        "best": best,
+        "missing": m["missing"],
+        "skipped": skipped,
+        "summary": summary,
+    }
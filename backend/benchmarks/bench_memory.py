@@ -0,0 +1,78 @@
+"""Bytes per cached city: per-call dicts vs slotted/columnar records.
+
+Run from backend/:  python -m benchmarks.bench_memory
+"""
+import json
+import tracemalloc
+
+from app.records import Forecast, WeatherRecord
+
+CITIES = 10000
+BLOCKS = 40  # 5 days x 8 three-hour blocks
+CONDITIONS = ["clouds", "rain", "clear", "mist", "drizzle"]
+
+
+def _upstream(i: int, j: int):
+    # Decode from JSON so strings are fresh objects, as they are from requests
+    return json.loads(json.dumps({
+        "dt_txt": f"2024-06-{1 + j // 8:02d} {(j % 8) * 3:02d}:00:00",
+        "temp": 20.0 + (i + j) % 15 + 0.37,
+        "humidity": 40 + (i + j) % 50,
+        "wind": 3.17 + j % 4,
+        "condition": CONDITIONS[(i + j) % len(CONDITIONS)],
+    }))
+
+
+def _measure(build) -> float:
+    tracemalloc.start()
+    kept = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size / CITIES
+
+
+def old_style():
+    out = []
+    for i in range(CITIES):
+        e = _upstream(i, 0)
+        weather = {
+            "city": f"city {i}".title(), "temp": e["temp"], "feels": e["temp"] + 1.5,
+            "humidity": e["humidity"], "visibility": 10.0, "wind": round(e["wind"], 1),
+            "wind_kmh": round(e["wind"] * 3.6, 1), "condition": e["condition"],
+        }
+        blocks = []
+        for j in range(BLOCKS):
+            e = _upstream(i, j)
+            blocks.append({
+                "dt_txt": e["dt_txt"], "temp": e["temp"], "humidity": e["humidity"],
+                "wind": round(e["wind"], 1), "wind_kmh": round(e["wind"] * 3.6, 1),
+                "condition": e["condition"],
+            })
+        out.append((weather, {"city": f"city {i}".title(), "forecast": blocks}))
+    return out
+
+
+def new_style():
+    out = []
+    for i in range(CITIES):
+        e = _upstream(i, 0)
+        weather = WeatherRecord(
+            city=f"city {i}".title(), temp=e["temp"], feels=e["temp"] + 1.5,
+            humidity=e["humidity"], visibility=10.0, wind=round(e["wind"], 1),
+            wind_kmh=round(e["wind"] * 3.6, 1), condition=e["condition"], observed_at=1717000000,
+        )
+        forecast = Forecast(f"city {i}".title())
+        for j in range(BLOCKS):
+            e = _upstream(i, j)
+            forecast.append(e["dt_txt"], e["temp"], e["humidity"], e["wind"], e["condition"])
+        out.append((weather, forecast.freeze()))
+    return out
+
+
+if __name__ == "__main__":
+    before = _measure(old_style)
+    after = _measure(new_style)
+    print(f"bytes per cached city (weather + {BLOCKS}-block forecast, {CITIES} cities)")
+    print(f"  dicts:   {before:9.0f}")
+    print(f"  records: {after:9.0f}   ({before / after:.1f}x smaller)")
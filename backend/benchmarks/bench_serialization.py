@@ -0,0 +1,81 @@
+"""CPU cost per response: default FastAPI/Pydantic path vs the lean orjson path.
+
+Run from backend/:  python -m benchmarks.bench_serialization
+"""
+import json
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app.records import WeatherRecord
+from app.schemas import AgentResponse, IntentResult, ReasoningStep
+from app.serialization import agent_payload, encode_weather_list, make_step
+
+
+def _weather(i: int) -> WeatherRecord:
+    return WeatherRecord(
+        city=f"City {i}",
+        temp=20.0 + i % 15,
+        feels=21.5 + i % 15,
+        humidity=40 + i % 50,
+        visibility=10.0,
+        wind=3.1,
+        wind_kmh=11.2,
+        condition="clouds",
+        observed_at=1717000000,
+    )
+
+
+def _cpu_us(fn, n: int) -> float:
+    start = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - start) / n * 1e6
+
+
+def bench_chat(n: int = 20000):
+    intent = IntentResult(intent="comparison", cities=["Pune", "Nashik"], confidence=0.9, is_multi_city=True)
+    answer = "Pune looks better for travel right now.\n\nTemperature: Pune 27.0°C vs Nashik 30.1°C\n"
+
+    def before():
+        steps = [
+            ReasoningStep(step="intent_detection", detail="Intent=comparison"),
+            ReasoningStep(step="tool_result", detail="Weather received for Pune"),
+            ReasoningStep(step="tool_result", detail="Weather received for Nashik"),
+        ]
+        resp = AgentResponse(answer=answer, reasoning=steps, intent=intent.intent, cities=intent.cities,
+                             confidence=intent.confidence, error=None)
+        # What FastAPI does with a returned model under response_model
+        resp = AgentResponse.model_validate(resp.model_dump())
+        json.dumps(jsonable_encoder(resp), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def after():
+        steps = [
+            make_step("intent_detection", "Intent=comparison"),
+            make_step("tool_result", "Weather received for Pune"),
+            make_step("tool_result", "Weather received for Nashik"),
+        ]
+        orjson.dumps(agent_payload(intent, steps, answer))
+
+    return _cpu_us(before, n), _cpu_us(after, n)
+
+
+def bench_batch(size: int = 100, n: int = 2000):
+    records = [_weather(i) for i in range(size)]
+    dicts = [r.to_dict() for r in records]
+
+    def before():
+        json.dumps(jsonable_encoder(dicts), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def after():
+        encode_weather_list(records)
+
+    return _cpu_us(before, n), _cpu_us(after, n)
+
+
+if __name__ == "__main__":
+    b, a = bench_chat()
+    print(f"/chat response:          before {b:8.1f} us   after {a:8.1f} us   ({b / a:.1f}x)")
+    b, a = bench_batch()
+    print(f"/weather/batch (100):    before {b:8.1f} us   after {a:8.1f} us   ({b / a:.1f}x)")
@@ -31,11 +31,10 @@ export async function fetchWeather(city){
 }
 
 export async function fetchWeatherBatch(cities){
-  const res = await fetch(joinUrl(backend, '/weather/batch'),{
-    method:'POST',
-    headers:{'Content-Type':'application/json'},
-    body: JSON.stringify({cities})
-  })
+  // GET so the browser/CDN HTTP cache can revalidate with ETag (304)
+  const url = new URL(joinUrl(backend, '/weather/batch'))
+  url.searchParams.set('cities', cities.join(','))
+  const res = await fetch(url, { method: 'GET' })
   if(!res.ok){
     const text = await res.text().catch(()=> '')
     throw new Error(`HTTP ${res.status}: ${text}`)